@@ -0,0 +1,90 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from advertiser_pool import AdvertiserPool
+
+# Advertiser dataset loader backed by a binary columnar cache.
+# The CSV is parsed once into compact typed columns saved next to it; later loads
+# read the cache unless the CSV's size/mtime changed and its content hash no longer matches.
+
+DATASET_FILE = 'advertiser_data_10k.csv'
+CACHE_SUFFIX = '.cache.npz'
+COLUMN_TYPES = {
+    'AdvertiserId': np.int32,
+    'Minimum_Impressions': np.int32,
+    'Budget': np.float32,
+    'Bid': np.float32,
+    'Reward': np.int32,
+    'Performance': np.float32,
+}
+
+
+# Column arrays of the advertiser dataset
+class AdvertiserData:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return self.columns['AdvertiserId'].size
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    # Sample n distinct rows; draws the same rows as DataFrame.sample(n, random_state=rng)
+    def sample_rows(self, n, rng):
+        return rng.choice(len(self), size=n, replace=False)
+
+    # Advertiser pool for the given rows, built straight from the column arrays
+    def pool(self, rows):
+        return AdvertiserPool(self.columns['AdvertiserId'][rows], self.columns['Bid'][rows], self.columns['Budget'][rows],
+                              self.columns['Minimum_Impressions'][rows], self.columns['Reward'][rows])
+
+    def to_frame(self):
+        return pd.DataFrame(self.columns)
+
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Write the cache file; goes to a temporary file first so concurrent loaders never see half a cache
+def _save_cache(cache_path, columns, csv_path, source_hash):
+    stat = os.stat(csv_path)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp.npz"
+    np.savez(temp_path, **columns,
+             _source_size=np.int64(stat.st_size), _source_mtime=np.int64(stat.st_mtime_ns),
+             _source_hash=np.array(source_hash))
+    os.replace(temp_path, cache_path)
+
+
+# Convert the CSV into compact typed columns and cache them
+def build_cache(csv_path, cache_path):
+    frame = pd.read_csv(csv_path)
+    columns = {name: frame[name].to_numpy().astype(dtype) for name, dtype in COLUMN_TYPES.items()}
+    _save_cache(cache_path, columns, csv_path, _file_hash(csv_path))
+    return columns
+
+
+# Load the advertiser dataset, using (and refreshing) the binary cache
+def load_advertiser_data(csv_path=DATASET_FILE, cache_path=None):
+    cache_path = cache_path or os.path.splitext(csv_path)[0] + CACHE_SUFFIX
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cache:
+            columns = {name: cache[name] for name in COLUMN_TYPES}
+            stat = os.stat(csv_path)
+            if int(cache['_source_size']) == stat.st_size and int(cache['_source_mtime']) == stat.st_mtime_ns:
+                return AdvertiserData(columns)
+            source_hash = _file_hash(csv_path)
+            if str(cache['_source_hash']) == source_hash:
+                # Touched but not changed: keep the columns, record the new mtime
+                _save_cache(cache_path, columns, csv_path, source_hash)
+                return AdvertiserData(columns)
+    return AdvertiserData(build_cache(csv_path, cache_path))
@@ -0,0 +1,47 @@
+import numpy as np
+
+# Struct-of-arrays pool of advertisers.
+# Holds the same fields as Advertiser, one typed array per field, so a whole
+# population is reset with array copies instead of deep-copying objects.
+class AdvertiserPool:
+    def __init__(self, names, bid, budget, min, reward):
+        self.names = np.asarray(names) # Advertiser names
+        self.bid = np.asarray(bid, dtype=np.float64) # Per impression bid
+        self.budget = np.asarray(budget, dtype=np.float64) # Budget to spend after minimum impressions are met
+        self.min = np.asarray(min, dtype=np.int64) # Minimum impressions required
+        self.reward = np.asarray(reward, dtype=np.float64) # Reward for meeting minimum impressions
+        self.max = self.min + (self.budget // self.bid).astype(np.int64) # Maximum possible impressions that can be allocated
+        self.allocated = np.zeros(self.min.size, dtype=np.int64) # Impressions allocated to each advertiser
+        self.remaining = self.min.copy() # Remaining impressions to meet the minimum
+
+    # Build a pool from a dict of Advertiser objects, keeping their order
+    @classmethod
+    def from_advertisers(cls, advertisers):
+        advertiser_list = list(advertisers.values())
+        pool = cls([adv.name for adv in advertiser_list], [adv.bid for adv in advertiser_list],
+                   [adv.budget for adv in advertiser_list], [adv.min for adv in advertiser_list],
+                   [adv.reward for adv in advertiser_list])
+        pool.allocated[:] = [adv.allocated for adv in advertiser_list]
+        pool.remaining[:] = [adv.remaining for adv in advertiser_list]
+        return pool
+
+    def __len__(self):
+        return self.min.size
+
+    def __str__(self):
+        return "\n".join(f"Advertiser {name} ->  {bid}, Minimum: {minimum}, Reward: {reward}, Allocated: {allocated}, Remaining: {remaining}"
+                         for name, bid, minimum, reward, allocated, remaining
+                         in zip(self.names, self.bid, self.min, self.reward, self.allocated, self.remaining))
+
+    # Back to the state before any allocation, O(n) and without new objects
+    def reset(self):
+        self.allocated[:] = 0
+        np.copyto(self.remaining, self.min)
+
+    # Revenue of every advertiser, zero unless the minimum was met
+    def calculate_revenue(self):
+        return np.where(self.allocated >= self.min, self.bid * self.allocated + self.reward, 0.0)
+
+    # Total revenue, summed in pool order like the Advertiser loops do
+    def total_revenue(self):
+        return np.cumsum(self.calculate_revenue())[-1] if len(self) else 0
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import numpy as np
+from advertiser_data import load_advertiser_data
+from traffic_simulator import TrafficSimulator
+from simulation_engine import Advertiser, Strategy
+from monte_carlo_harness import BiddingSimulator, NUM_TIME_SLOTS
+from monte_carlo_ratio import optimal_revenue, MIN_IMPRESSIONS, MAX_IMPRESSIONS
+
+# Benchmarks of the simulator hot paths at scaled sizes.
+# Every benchmark is timed for each (advertisers, slots) size it supports; the report gives the
+# best time, throughput and the scaling exponent (slope of log time against log size).
+# Results are compared with stored baselines and slowdowns beyond REGRESSION_THRESHOLD are flagged.
+
+ADVERTISER_COUNTS = [10, 100, 1000, 10000] # Advertisers sampled from the dataset
+SLOT_COUNTS = [24, 240, 1440] # Time slots per simulated run
+SCALAR_MAX_ADVERTISERS = 1000 # Per-object (dict of Advertiser) paths only up to this size
+MIN_TIME = 0.2 # Each size is repeated until this many seconds have passed...
+MAX_REPEATS = 20 # ...or this many repeats
+SEED = 0 # Advertiser samples and traffic are fixed, so runs are comparable
+BASELINE_FILE = 'benchmark_baseline.json' # Timings of this machine, kept out of version control
+RESULTS_FILE = 'benchmark_results.json'
+SAVE_BASELINE = False # Store this run as the new baseline instead of comparing with it
+REGRESSION_THRESHOLD = 0.25 # Flag a size that is more than 25% slower than its baseline
+
+
+# Fixed inputs of one size: advertisers as a pool and as Advertiser objects, plus traffic
+class BenchmarkInputs:
+    def __init__(self, data, num_advertisers, num_time_slots):
+        rng = np.random.default_rng(SEED)
+        self.pool = data.pool(data.sample_rows(num_advertisers, rng))
+        self.num_advertisers = num_advertisers
+        self.num_time_slots = num_time_slots
+        self.traffic = TrafficSimulator(MIN_IMPRESSIONS, MAX_IMPRESSIONS)
+        self.actual_impressions = self.traffic.get_actual_impressions(num_time_slots, rng=rng)
+
+    def advertisers(self):
+        return {str(name): Advertiser(str(name), float(bid), float(budget), int(minimum), float(reward))
+                for name, bid, budget, minimum, reward
+                in zip(self.pool.names, self.pool.bid, self.pool.budget, self.pool.min, self.pool.reward)}
+
+
+def bench_simulate_bidding_pool(inputs):
+    simulator = BiddingSimulator()
+    simulator.rng = np.random.default_rng(SEED)
+    def run():
+        inputs.pool.reset()
+        simulator.run_simulation(inputs.num_time_slots, custom_advertisers=inputs.pool, actual_impressions=inputs.actual_impressions)
+    return run, inputs.num_advertisers * inputs.num_time_slots
+
+
+def bench_simulate_bidding_dict(inputs):
+    simulator = BiddingSimulator()
+    def run():
+        simulator.run_simulation(inputs.num_time_slots, custom_advertisers=inputs.advertisers(), run_gpg=False, actual_impressions=inputs.actual_impressions)
+    return run, inputs.num_advertisers * inputs.num_time_slots
+
+
+def bench_gpg(inputs):
+    strategy = Strategy()
+    advertisers = inputs.advertisers()
+    def run():
+        for _ in range(100):
+            strategy.gpg(advertisers)
+    return run, 100 * inputs.num_advertisers
+
+
+def bench_gpg_block(inputs):
+    strategy = Strategy(rng=np.random.default_rng(SEED))
+    advertisers = inputs.advertisers()
+    impressions = int(inputs.actual_impressions.sum())
+    def run():
+        for advertiser in advertisers.values():
+            advertiser.allocated = 0
+        strategy.gpg_block(advertisers, impressions)
+    return run, impressions * inputs.num_advertisers
+
+
+def bench_get_estimated_allocation(inputs):
+    strategy = Strategy()
+    advertiser_list = strategy.order(inputs.advertisers(), 0)
+    def run():
+        for time_slot in range(inputs.num_time_slots):
+            strategy.estimated_allocation(advertiser_list, 2500, time_slot)
+    return run, inputs.num_advertisers * inputs.num_time_slots
+
+
+def bench_optimal_revenue(inputs):
+    def run():
+        optimal_revenue(inputs.pool, inputs.actual_impressions)
+    return run, inputs.num_advertisers
+
+
+def bench_get_actual_impressions(inputs):
+    rng = np.random.default_rng(SEED)
+    def run():
+        for _ in range(100):
+            inputs.traffic.get_actual_impressions(inputs.num_time_slots, rng=rng)
+    return run, 100 * inputs.num_time_slots
+
+
+# name -> (benchmark, largest advertiser count, sizes along advertisers and/or slots)
+BENCHMARKS = {
+    'simulate_bidding_pool': (bench_simulate_bidding_pool, max(ADVERTISER_COUNTS), ('advertisers', 'slots')),
+    'simulate_bidding_dict': (bench_simulate_bidding_dict, SCALAR_MAX_ADVERTISERS, ('advertisers', 'slots')),
+    'gpg': (bench_gpg, max(ADVERTISER_COUNTS), ('advertisers',)),
+    'gpg_block': (bench_gpg_block, max(ADVERTISER_COUNTS), ('advertisers',)),
+    'get_estimated_allocation': (bench_get_estimated_allocation, max(ADVERTISER_COUNTS), ('advertisers',)),
+    'optimal_revenue': (bench_optimal_revenue, max(ADVERTISER_COUNTS), ('advertisers',)),
+    'get_actual_impressions': (bench_get_actual_impressions, min(ADVERTISER_COUNTS), ('slots',)),
+}
+
+
+# Best time of repeated runs
+def time_run(run):
+    best = float('inf')
+    spent = 0.0
+    for _ in range(MAX_REPEATS):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        spent += elapsed
+        if spent >= MIN_TIME:
+            break
+    return best
+
+
+def sizes_of(largest, axes):
+    advertiser_counts = [n for n in ADVERTISER_COUNTS if n <= largest] if 'advertisers' in axes else [min(ADVERTISER_COUNTS)]
+    slot_counts = SLOT_COUNTS if 'slots' in axes else [NUM_TIME_SLOTS]
+    return [(n, slots) for n in advertiser_counts for slots in slot_counts]
+
+
+# Slope of log time against log work units
+def scaling_exponent(units, seconds):
+    if len(set(units)) < 2:
+        return None
+    return float(np.polyfit(np.log(units), np.log(seconds), 1)[0])
+
+
+def run_benchmarks(names=None):
+    data = load_advertiser_data()
+    results = {}
+    for name, (benchmark, largest, axes) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        rows = {}
+        for num_advertisers, num_time_slots in sizes_of(largest, axes):
+            run, units = benchmark(BenchmarkInputs(data, num_advertisers, num_time_slots))
+            seconds = time_run(run)
+            rows[f"{num_advertisers}x{num_time_slots}"] = {'seconds': seconds, 'units': units, 'throughput': units / seconds}
+            print(f"{name} [{num_advertisers} advertisers x {num_time_slots} slots]: {seconds * 1e3:.3f} ms, {units / seconds:.0f} units/s")
+        exponent = scaling_exponent([row['units'] for row in rows.values()], [row['seconds'] for row in rows.values()])
+        results[name] = {'sizes': rows, 'scaling_exponent': exponent}
+        if exponent is not None:
+            print(f"{name} scaling exponent: {exponent:.2f}")
+    return results
+
+
+# Sizes whose time grew by more than threshold over the baseline
+def find_regressions(results, baseline, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    for name, result in results.items():
+        for size, row in result['sizes'].items():
+            before = baseline.get(name, {}).get('sizes', {}).get(size)
+            if before and row['seconds'] > before['seconds'] * (1 + threshold):
+                regressions.append((name, size, before['seconds'], row['seconds']))
+    return regressions
+
+
+def main():
+    results = run_benchmarks()
+    with open(RESULTS_FILE, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if SAVE_BASELINE or not os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {BASELINE_FILE}")
+        return
+
+    with open(BASELINE_FILE) as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline)
+    print("\n--- REGRESSIONS ---" if regressions else "\nNo regressions against the baseline")
+    for name, size, before, after in regressions:
+        print(f"{name} [{size}]: {before * 1e3:.3f} ms -> {after * 1e3:.3f} ms ({after / before - 1:+.0%})")
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
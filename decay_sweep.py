@@ -0,0 +1,218 @@
+import math
+import time
+import numpy as np
+from advertiser_pool import AdvertiserPool
+from instrumentation import Instrumentation
+from slot_allocation import water_fill_rows
+
+# Vectorized minimum-impression phase of BiddingSimulator.simulate_bidding.
+# Every decay factor is simulated at once as one row of a (decay_factors x advertisers)
+# state matrix. Columns are kept in priority order (min * bid, descending), so the
+# active advertisers of a row are exactly the scalar simulator's active list (simulation_engine.ActiveSet).
+
+NO_INSTRUMENTATION = Instrumentation() # Default instrumentation, disabled
+SLOT_ALLOCATION = "water_filling" # "water_filling" splits each slot in closed form, "passes" replays the truncated estimates pass after pass
+
+
+# Priority order used by sort_advertisers (stable, highest min * bid first)
+def priority_order(bids, mins):
+    return np.argsort(-(np.asarray(mins, dtype=np.float64) * np.asarray(bids, dtype=np.float64)), kind="stable")
+
+
+# Strategy.split_estimate for every row of active advertisers: the first one's share, the
+# impressions left to share, which advertisers share them and their weights remaining * bid
+# with the total of those weights
+def split_estimate_matrix(bids, rem, act, estimated, decay_probabilities):
+    num_rows = rem.shape[0]
+    first = act.argmax(axis=1)
+    decayed = np.array([int(estimated * p) for p in decay_probabilities], dtype=np.int64)
+    first_adv = np.minimum(decayed, rem[np.arange(num_rows), first])
+    impressions_left = estimated - first_adv + (decayed - first_adv)
+
+    # Weighted remaining demand of everyone behind the first advertiser, summed left to right
+    others = act.copy()
+    others[np.arange(num_rows), first] = False
+    weights = np.where(others, rem * bids, 0.0)
+    remaining_total = np.cumsum(weights, axis=1)[:, -1]
+    return first, first_adv, impressions_left, others, weights, remaining_total
+
+
+# Estimated allocation of every row for one time slot, indexed by position in the remaining list
+def estimated_allocation_matrix(bids, remaining, active, estimated, decay_probabilities):
+    num_rows, num_advertisers = remaining.shape
+    allocation = np.zeros((num_rows, num_advertisers), dtype=np.int64)
+    rows = np.flatnonzero(active.any(axis=1))
+    if rows.size == 0:
+        return allocation
+
+    act = active[rows]
+    first, first_adv, impressions_left, others, weights, remaining_total = split_estimate_matrix(bids, remaining[rows], act, estimated, decay_probabilities[rows])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = np.trunc((weights / remaining_total[:, None]) * impressions_left[:, None])
+    shares = np.where(others, shares, 0).astype(np.int64)
+
+    # Scatter from advertiser columns to remaining-list positions
+    positions = np.cumsum(act, axis=1) - 1
+    row_allocation = np.zeros_like(shares)
+    r, c = np.nonzero(others)
+    row_allocation[r, positions[r, c]] = shares[r, c]
+    row_allocation[:, 0] = first_adv
+    allocation[rows] = row_allocation
+    return allocation
+
+
+# Strategy.allocation_weights for every row of active advertisers, in advertiser columns
+def allocation_weights_matrix(bids, rem, act, estimated, decay_probabilities):
+    first, first_adv, impressions_left, others, weights, remaining_total = split_estimate_matrix(bids, rem, act, estimated, decay_probabilities)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = (weights / remaining_total[:, None]) * impressions_left[:, None]
+    shares = np.where(others & (remaining_total[:, None] > 0), shares, 0.0)
+    shares[np.arange(rem.shape[0]), first] = first_adv
+    return shares
+
+
+# Run the minimum-impression phase for every decay factor at once.
+# bids/mins are in priority order. Returns the remaining minimums (rows x advertisers)
+# and, per row, the impressions left over after every minimum was met (what GPG would serve).
+# With water-filling each pass splits what is left of the slot among the active advertisers in
+# closed form (water_fill_rows); with passes the slot's truncated estimate is replayed.
+# Instrumentation counts slots, passes and satisfactions summed over the rows, like one scalar
+# run per row; passes skipped ahead count once each.
+def simulate_minimum_phase(bids, mins, actual_impressions, estimated_impressions, decay_factors, num_time_slots, remaining=None,
+                           instrumentation=NO_INSTRUMENTATION, slot_allocation=SLOT_ALLOCATION):
+    bids = np.asarray(bids, dtype=np.float64)
+    decay_factors = np.atleast_1d(np.asarray(decay_factors, dtype=np.float64))
+    num_rows = decay_factors.size
+    if remaining is None:
+        remaining = np.tile(np.asarray(mins, dtype=np.int64), (num_rows, 1))
+    else:
+        remaining = np.array(remaining, dtype=np.int64, copy=True)
+    active = remaining > 0
+    leftover = np.zeros(num_rows, dtype=np.int64)
+    all_rows = np.arange(num_rows)
+    instrumented = instrumentation.enabled
+    filling = slot_allocation == "water_filling"
+
+    for time_slot in range(num_time_slots):
+        if instrumented:
+            instrumentation.count('slots', num_rows)
+        actual = np.full(num_rows, int(actual_impressions[time_slot]), dtype=np.int64)
+        decay_probabilities = np.array([math.exp(-d * time_slot) for d in decay_factors])
+        estimated = int(estimated_impressions[time_slot])
+        if not filling:
+            # The scalar loop computes the allocation once per slot and keeps indexing it by
+            # list position while satisfied advertisers drop out; positions are replayed here
+            allocation = estimated_allocation_matrix(bids, remaining, active, estimated, decay_probabilities)
+        running = actual > 0
+
+        while running.any():
+            if instrumented:
+                started = time.perf_counter()
+            rows = all_rows[running]
+            act = active[rows]
+            empty = ~act.any(axis=1)
+            if empty.any():
+                # No minimums left: the rest of the slot belongs to GPG
+                leftover[rows[empty]] += actual[rows[empty]]
+                actual[rows[empty]] = 0
+                running[rows[empty]] = False
+                rows = rows[~empty]
+                act = act[~empty]
+                if rows.size == 0:
+                    break
+
+            rem = remaining[rows]
+            row_actual = actual[rows]
+            if filling:
+                # The whole rest of the slot in one pass; another follows only once the takers are full
+                weights = allocation_weights_matrix(bids, rem, act, estimated, decay_probabilities[rows])
+                taken = water_fill_rows(weights, np.where(act, rem, 0), row_actual)
+                repeats = np.zeros(rows.size, dtype=np.int64)
+            else:
+                positions = np.where(act, np.cumsum(act, axis=1) - 1, 0)
+                per_pass = np.where(act, np.maximum(np.take_along_axis(allocation[rows], positions, axis=1), 0), 0)
+
+                # Skip ahead over passes that serve their full allocation without satisfying anyone,
+                # since those leave the remaining list (and therefore the next pass) unchanged
+                pass_total = per_pass.sum(axis=1)
+                until_satisfied = np.where(per_pass > 0, (rem - 1) // np.maximum(per_pass, 1), np.iinfo(np.int64).max)
+                repeats = np.minimum(until_satisfied.min(axis=1), row_actual // np.maximum(pass_total, 1))
+                repeats = np.where(pass_total > 0, repeats, 0)
+                rem = rem - repeats[:, None] * per_pass
+                row_actual = row_actual - repeats * pass_total
+
+                wanted = np.where(act, np.minimum(per_pass, rem), 0)
+                before = np.cumsum(wanted, axis=1) - wanted
+                taken = np.minimum(wanted, np.maximum(row_actual[:, None] - before, 0))
+            served = taken.sum(axis=1)
+
+            remaining[rows] = rem - taken
+            if instrumented:
+                allocated = time.perf_counter()
+                instrumentation.add_time('minimum_phase', allocated - started)
+            still_active = act & (remaining[rows] > 0)
+            active[rows] = still_active
+            if instrumented:
+                instrumentation.add_time('check_satisfaction', time.perf_counter() - allocated)
+                instrumentation.count('passes', int(rows.size + repeats.sum()))
+                instrumentation.count('satisfactions', int(act.sum() - still_active.sum()))
+            actual[rows] = row_actual - served
+            # A pass that serves nothing would repeat forever; the slot's remainder is dropped
+            running[rows] = (actual[rows] > 0) & (served + repeats > 0)
+
+    return remaining, leftover
+
+
+# Revenue of every row when the minimum phase is the whole run (GPG disabled)
+def minimum_phase_revenue(bids, mins, rewards, remaining):
+    bids = np.asarray(bids, dtype=np.float64)
+    mins = np.asarray(mins, dtype=np.float64)
+    rewards = np.asarray(rewards, dtype=np.float64)
+    revenue = np.where(remaining <= 0, bids * mins + rewards, 0.0)
+    return np.cumsum(revenue, axis=1)[:, -1] if revenue.shape[1] else np.zeros(revenue.shape[0])
+
+
+# Revenue-vs-decay curve for an AdvertiserPool or a dict of Advertiser objects, one entry per decay factor
+def decay_sweep(advertisers, actual_impressions, estimated_impressions, decay_factors, num_time_slots, instrumentation=NO_INSTRUMENTATION,
+                slot_allocation=SLOT_ALLOCATION):
+    if not isinstance(advertisers, AdvertiserPool):
+        advertisers = AdvertiserPool.from_advertisers(advertisers)
+    bids, mins, rewards, remaining = advertisers.bid, advertisers.min, advertisers.reward, advertisers.remaining
+
+    order = priority_order(bids, mins)
+    num_rows = np.atleast_1d(decay_factors).size
+    sorted_remaining, _ = simulate_minimum_phase(bids[order], mins[order], actual_impressions, estimated_impressions,
+                                                 decay_factors, num_time_slots, np.tile(remaining[order], (num_rows, 1)), instrumentation,
+                                                 slot_allocation)
+    # Back to the dict's insertion order so revenue is summed like calculate_revenue loops
+    final_remaining = np.empty_like(sorted_remaining)
+    final_remaining[:, order] = sorted_remaining
+    return minimum_phase_revenue(bids, mins, rewards, final_remaining)
+
+
+# Coarse-to-fine search for the best decay factor on a grid of num_factors points.
+# evaluate(indices) returns the revenue at those grid points. The grid is first sampled every
+# coarse_stride points; then each interval that is wider than one step, changes value and touches
+# one of the `keep` best values seen so far is split in half, until no such interval is left.
+# Intervals with equal ends are taken as flat, so the best point is always resolved to one grid
+# step; coarse_stride=1 evaluates the whole grid.
+# The search assumes the curve is close to unimodal at the coarse scale. It can miss the global
+# maximum when that lies in a narrow peak between two coarse points that are not among the best
+# (the interval is never split), or inside an interval whose ends happen to be equal (taken as
+# flat), and ties can resolve to a different decay factor than a full grid would pick.
+# Returns the curve (NaN where it was not evaluated) and the number of evaluations.
+def adaptive_decay_search(evaluate, num_factors, coarse_stride=10, keep=1):
+    curve = np.full(num_factors, np.nan)
+    evaluations = 0
+    indices = np.union1d(np.arange(0, num_factors, coarse_stride), [num_factors - 1])
+    while indices.size:
+        curve[indices] = evaluate(indices)
+        evaluations += indices.size
+
+        points = np.flatnonzero(~np.isnan(curve))
+        top = np.unique(curve[points])[-keep:][0]
+        a, b = points[:-1], points[1:]
+        refine = (b - a > 1) & (curve[a] != curve[b]) & (np.maximum(curve[a], curve[b]) >= top)
+        steps = np.maximum(1, (b - a) // 2)
+        indices = np.array([i for lo, hi, step in zip(a[refine], b[refine], steps[refine]) for i in range(lo + step, hi, step)], dtype=np.int64)
+    return curve, evaluations
@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import math
+import numpy as np
+
+# Binary event trace of a bidding simulation, in place of formatted print() calls on the hot path.
+# Events are fixed-size records written into a preallocated buffer. Without a path the buffer is a
+# ring that keeps the latest events; with a path it is flushed to <path>/events.bin whenever it fills.
+# The decoder below rebuilds the human-readable report offline.
+
+TRACE_PATH = 'bidding_events' # Trace decoded by main()
+RING_CAPACITY = 1 << 16 # Events buffered in memory
+EVENTS_FILE = 'events.bin'
+SCHEMA_FILE = 'schema.json'
+
+# Levels, as in logging: a recorder keeps the events at or above its level
+DEBUG = 10 # Every allocation, estimate, preference and GPG win
+INFO = 20 # Slots, bid adjustments, satisfactions
+OFF = 100
+
+# Event kinds
+ADVERTISER = 0 # An advertiser entered the simulation
+SLOT = 1 # count: actual impressions, total: estimated impressions
+BID_ADJUSTMENT = 2 # a: old bid, b: new bid, c: performance ratio, d: budget ratio
+PREFERENCE = 3 # a: base bid, b: time multiplier, c: effective bid
+ESTIMATE = 4 # count: estimated allocation, total: position in the allocation list
+ALLOCATION = 5 # count: impressions allocated, total: impressions offered, a: payment, b: effective bid
+SATISFACTION = 6 # The advertiser met its minimum impressions
+GPG_ALLOCATION = 7 # count: impressions won, a: effective bid (NaN without time multipliers); no advertiser for a whole GPG block
+GPG_EXHAUSTED = 8 # count: 1 when budgets also limit GPG
+SLOT_END = 9 # a: slot revenue
+BID_ADJUSTMENTS = 10 # Bids are about to be adjusted
+
+EVENT_LEVELS = (INFO, INFO, INFO, DEBUG, DEBUG, DEBUG, INFO, DEBUG, INFO, INFO, INFO) # Level of each kind
+
+EVENT_DTYPE = np.dtype([
+    ('kind', np.uint8),
+    ('slot', np.int32),
+    ('advertiser', np.int32),
+    ('count', np.int64),
+    ('total', np.int64),
+    ('a', np.float64),
+    ('b', np.float64),
+    ('c', np.float64),
+    ('d', np.float64),
+])
+
+
+class EventRecorder:
+    def __init__(self, path=None, level=INFO, capacity=RING_CAPACITY):
+        self.path = path
+        self.level = level
+        self.capacity = capacity
+        self.buffer = None # Allocated by the first recorded event, so a recorder that is off costs nothing
+        self.size = 0 # Events in the buffer
+        self.recorded = 0 # Events recorded in total
+        self.names = [] # Advertiser index -> name
+        self.index = {}
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            open(os.path.join(path, EVENTS_FILE), 'wb').close()
+            self._write_schema()
+
+    def enabled(self, kind):
+        return EVENT_LEVELS[kind] >= self.level
+
+    # Index of an advertiser name in the trace's name table
+    def advertiser(self, name):
+        index = self.index.get(name)
+        if index is None:
+            index = self.index[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def record(self, kind, slot=-1, advertiser=None, count=0, total=0, a=0.0, b=0.0, c=0.0, d=0.0):
+        if EVENT_LEVELS[kind] < self.level:
+            return
+        if self.buffer is None:
+            self.buffer = np.zeros(self.capacity, dtype=EVENT_DTYPE)
+        advertiser = -1 if advertiser is None else self.advertiser(advertiser)
+        self.buffer[self.recorded % self.capacity if self.path is None else self.size] = (kind, slot, advertiser, count, total, a, b, c, d)
+        self.recorded += 1
+        self.size = min(self.size + 1, self.capacity)
+        if self.path is not None and self.size == self.capacity:
+            self.flush()
+
+    def _write_schema(self):
+        schema = {'version': 1, 'level': self.level, 'names': self.names}
+        tmp = os.path.join(self.path, SCHEMA_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(schema, f)
+        os.replace(tmp, os.path.join(self.path, SCHEMA_FILE))
+
+    # Append the buffered events to the trace file (a no-op for an in-memory ring)
+    def flush(self):
+        if self.path is None:
+            return
+        if self.size:
+            with open(os.path.join(self.path, EVENTS_FILE), 'ab') as f:
+                self.buffer[:self.size].tofile(f)
+            self.size = 0
+        self._write_schema()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Buffered events, oldest first (for a trace file, read it back with read_events instead)
+    def events(self):
+        if self.buffer is None:
+            return np.zeros(0, dtype=EVENT_DTYPE)
+        if self.path is not None or self.recorded <= self.capacity:
+            return self.buffer[:self.size]
+        start = self.recorded % self.capacity
+        return np.concatenate([self.buffer[start:], self.buffer[:start]])
+
+
+# (events, advertiser names) of a trace directory; events are memory-mapped
+def read_events(path):
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        names = json.load(f)['names']
+    events_path = os.path.join(path, EVENTS_FILE)
+    if os.path.getsize(events_path) == 0:
+        return np.zeros(0, dtype=EVENT_DTYPE), names
+    return np.memmap(events_path, dtype=EVENT_DTYPE, mode='r'), names
+
+
+# Print events as the simulation's original text report
+def render(events, names, out=sys.stdout):
+    previous = None
+    estimate = None # Estimated allocation list being collected, one ESTIMATE event per entry
+    for event in events:
+        kind = event['kind']
+        slot = event['slot']
+        name = names[event['advertiser']] if event['advertiser'] >= 0 else None
+        if estimate is not None and (kind != ESTIMATE or event['total'] == 0):
+            print(f"Estimated Allocation: {estimate}", file=out)
+            estimate = None
+        if kind == ADVERTISER:
+            print(f"Created Advertiser {name}!", file=out)
+        elif kind == SLOT:
+            print(f"\n--- {slot} To {slot+1} HOURS ---", file=out)
+            print(f"Actual Impressions: {event['count']}, Estimated Impressions: {event['total']}", file=out)
+        elif kind == BID_ADJUSTMENTS:
+            print("\n--- BID ADJUSTMENTS ---", file=out)
+        elif kind == BID_ADJUSTMENT:
+            print(f"{name}'s bid adjusted from {event['a']:.2f} to {event['b']:.2f} (perf:{event['c']:.2f}, budget:{event['d']:.2f})", file=out)
+        elif kind == PREFERENCE:
+            if previous != PREFERENCE:
+                print("\n--- TIME-SPECIFIC PREFERENCES ---", file=out)
+            print(f"{name}: Base bid: {event['a']:.2f}, Multiplier: {event['b']:.2f}, Effective bid: {event['c']:.2f}", file=out)
+        elif kind == ESTIMATE:
+            estimate = (estimate or []) + [int(event['count'])]
+        elif kind == ALLOCATION:
+            print(f"Allocated {event['count']} impressions (out of {event['total']}) to {name} at {event['a']:.2f} per impression (effective bid: {event['b']:.2f})", file=out)
+        elif kind == SATISFACTION:
+            print(f"Advertiser {name} has met minimum impressions!", file=out)
+        elif kind == GPG_ALLOCATION:
+            if name is None:
+                print(f"Allocated {event['count']} impressions by GPG", end=" | ", file=out)
+            elif math.isnan(event['a']):
+                print(f"Allocated {event['count']} impressions to {name} by GPG", end=" | ", file=out)
+            else:
+                print(f"Allocated {event['count']} impressions to {name} by GPG (effective: {event['a']:.2f})", end=" | ", file=out)
+        elif kind == GPG_EXHAUSTED:
+            print("All advertisers have reached their maximum impressions" + (" or budget!" if event['count'] else "!"), file=out)
+        elif kind == SLOT_END:
+            print(f"\nSlot Revenue: {event['a']:.2f}", file=out)
+        previous = kind
+    if estimate is not None:
+        print(f"Estimated Allocation: {estimate}", file=out)
+
+
+def main():
+    events, names = read_events(TRACE_PATH)
+    render(events, names)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import numpy as np
+
+# Batched Generalized Perturbed-Greedy allocation.
+# Each impression goes to argmax_i bid_i * (1 - exp(beta * (u_i - 1))) over advertisers with room left,
+# with a fresh u_i ~ U(0, 1) per advertiser and impression, exactly like the per-impression gpg().
+
+BETA = 0.15
+BLOCK_CELLS = 1 << 20 # Perturbations drawn per block (impressions x advertisers)
+QUADRATURE_NODES = 32 # Gauss-Legendre nodes per piece of the win-probability integral
+
+
+# Place up to num_impressions by GPG; capacity is how many more impressions each advertiser may take.
+# Returns the number of impressions won by each advertiser.
+def gpg_allocate(bids, capacity, num_impressions, beta=BETA, rng=None, block_cells=BLOCK_CELLS):
+    rng = rng if rng is not None else np.random.default_rng()
+    bids = np.asarray(bids, dtype=np.float64)
+    room = np.ceil(np.asarray(capacity, dtype=np.float64)).astype(np.int64)
+    wins = np.zeros(bids.size, dtype=np.int64)
+    left = int(num_impressions)
+    block_rows = max(1, block_cells // max(1, bids.size))
+
+    while left > 0:
+        candidates = np.flatnonzero(room > 0)
+        if candidates.size == 0:
+            break
+        block = min(left, block_rows, max(1, block_cells // candidates.size))
+        perturbed = bids[candidates] * (1 - np.exp(beta * (rng.random((block, candidates.size)) - 1)))
+        winners = candidates[perturbed.argmax(axis=1)]
+        counts = np.bincount(winners, minlength=bids.size)
+
+        # Once an advertiser fills up, later impressions must be drawn without it:
+        # keep the block only up to the first impression that fills someone past their room
+        overfull = np.flatnonzero(counts > room)
+        if overfull.size:
+            block = min(int(np.flatnonzero(winners == i)[room[i] - 1]) for i in overfull) + 1
+            counts = np.bincount(winners[:block], minlength=bids.size)
+            # Size the next block to roughly the distance between fill-ups to waste fewer draws
+            block_rows = max(16, 2 * block)
+        else:
+            block_rows = 2 * block_rows
+
+        wins += counts
+        room -= counts
+        left -= block
+    return wins
+
+
+# Probability of each advertiser winning one impression under i.i.d. perturbations.
+# The perturbed bid X_i = bid_i * (1 - exp(beta * (u - 1))) lives on [0, top_i] with
+# CDF F_i(x) = -log(1 - x / bid_i) / beta and density 1 / (beta * (bid_i - x)), so
+# P(i wins) = integral of f_i(x) * prod_{j != i} F_j(x) dx, taken by Gauss-Legendre
+# quadrature between consecutive tops (the integrand is smooth on each piece).
+# Equal bids share one column, and pieces where the product is negligible are skipped.
+def win_probabilities(bids, beta=BETA, nodes=QUADRATURE_NODES, block_cells=BLOCK_CELLS):
+    bids = np.asarray(bids, dtype=np.float64)
+    values, inverse, multiplicity = np.unique(bids, return_inverse=True, return_counts=True)
+    positive = values > 0
+    if not positive.any():
+        # Every perturbed bid is zero, the first advertiser wins every tie
+        probabilities = np.zeros(bids.size)
+        probabilities[0] = 1.0
+        return probabilities
+    values, multiplicity = values[positive], multiplicity[positive]
+    tops = values * (1 - np.exp(-beta))
+
+    def log_cdf(xs):
+        inside = xs < tops
+        cdf = -np.log1p(-np.where(inside, xs / values, 0.0)) / beta
+        return np.log(np.where(inside, cdf, 1.0)), inside
+
+    # Everything below the first top where prod F_j exceeds e^-60 contributes nothing measurable
+    edges = np.concatenate(([0.0], tops))
+    edge_totals = (log_cdf(edges[1:, None])[0] * multiplicity).sum(axis=1)
+    first = int(np.searchsorted(edge_totals, -60.0))
+    edges = edges[first:]
+
+    t, w = np.polynomial.legendre.leggauss(nodes)
+    lo, hi = edges[:-1, None], edges[1:, None]
+    x = (lo + (hi - lo) * (t + 1) / 2).ravel()
+    weights = ((hi - lo) / 2 * w).ravel()
+
+    unique_probabilities = np.zeros(values.size)
+    rows = max(1, block_cells // values.size)
+    for start in range(0, x.size, rows):
+        xs = x[start:start + rows, None]
+        logs, inside = log_cdf(xs)
+        density = np.where(inside, 1 / (beta * np.where(inside, values - xs, 1.0)), 0.0)
+        others = np.exp((logs * multiplicity).sum(axis=1, keepdims=True) - logs)
+        unique_probabilities += (weights[start:start + rows, None] * density * others).sum(axis=0)
+
+    probabilities = np.zeros(positive.size)
+    probabilities[positive] = unique_probabilities
+    probabilities = probabilities[inverse]
+    return probabilities / probabilities.sum()
+
+
+# Same allocation as gpg_allocate, drawn as a few multinomial runs instead of per-impression argmaxes.
+# Win probabilities are recomputed only when the set of advertisers with room changes.
+def gpg_allocate_multinomial(bids, capacity, num_impressions, beta=BETA, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    bids = np.asarray(bids, dtype=np.float64)
+    room = np.ceil(np.asarray(capacity, dtype=np.float64)).astype(np.int64)
+    wins = np.zeros(bids.size, dtype=np.int64)
+    left = int(num_impressions)
+    candidates = None
+
+    while left > 0:
+        current = np.flatnonzero(room > 0)
+        if current.size == 0:
+            break
+        if candidates is None or not np.array_equal(current, candidates):
+            candidates = current
+            probabilities = win_probabilities(bids[candidates], beta)
+
+        # Draw a run a little longer than the expected wait for the first advertiser to fill up
+        reachable = probabilities > 1e-12
+        run = left
+        if reachable.any():
+            until_full = (room[candidates][reachable] / probabilities[reachable]).min()
+            run = int(min(left, 1.25 * until_full + 64))
+        counts = rng.multinomial(run, probabilities)
+
+        overfull = np.flatnonzero(counts > room[candidates])
+        if overfull.size:
+            # Multinomial counts in uniformly random order are the i.i.d. winner sequence;
+            # keep it only up to the impression that fills the first advertiser
+            sequence = rng.permutation(np.repeat(np.arange(candidates.size), counts))
+            run = min(int(np.flatnonzero(sequence == i)[room[candidates[i]] - 1]) for i in overfull) + 1
+            counts = np.bincount(sequence[:run], minlength=candidates.size)
+
+        wins[candidates] += counts
+        room[candidates] -= counts
+        left -= run
+    return wins
+
+
+GPG_METHODS = {
+    "block": gpg_allocate,
+    "multinomial": gpg_allocate_multinomial,
+}
@@ -0,0 +1,137 @@
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import nullcontext
+
+# Low-overhead instrumentation of the simulator hot paths.
+# Phase timers, counters and peaks are recorded per simulation, returned with its result and
+# summed across simulations (and worker processes) into one report. When disabled, timer()
+# hands back a shared no-op context and count() returns at once, so the hooks cost next to nothing.
+
+_NULL_TIMER = nullcontext()
+
+
+class _Timer:
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.instrumentation.add_time(self.name, time.perf_counter() - self.start)
+
+
+# pstats.Stats can load anything with create_stats() and a stats dict
+class _ProfileStats:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class Instrumentation:
+    def __init__(self, enabled=False, profile=False, trace_memory=False):
+        self.enabled = enabled
+        self.profile = profile # Capture a cProfile of every simulation
+        self.trace_memory = trace_memory # Record every simulation's peak traced memory (tracemalloc)
+        self.reset()
+
+    def reset(self):
+        self.timers = {} # name -> [seconds, calls]
+        self.counters = {}
+        self.peaks = {}
+        self.profile_stats = None
+        self.simulations = 0
+
+    def timer(self, name):
+        return _Timer(self, name) if self.enabled else _NULL_TIMER
+
+    def add_time(self, name, seconds):
+        timer = self.timers.setdefault(name, [0.0, 0])
+        timer[0] += seconds
+        timer[1] += 1
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def peak(self, name, value):
+        if self.enabled and value > self.peaks.get(name, float('-inf')):
+            self.peaks[name] = value
+
+    # Run one simulation under the optional profilers and return (result, snapshot of its measurements)
+    def capture(self, function, *args, **kwargs):
+        self.reset()
+        profiler = cProfile.Profile() if self.profile else None
+        if self.trace_memory:
+            tracemalloc.start()
+        try:
+            with self.timer('simulation'):
+                result = profiler.runcall(function, *args, **kwargs) if profiler else function(*args, **kwargs)
+        finally:
+            if self.trace_memory:
+                self.peak('peak_traced_bytes', tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+        if profiler:
+            profiler.create_stats()
+            self.profile_stats = profiler.stats
+        self.simulations = 1
+        return result, self.snapshot()
+
+    def snapshot(self):
+        return {
+            'simulations': self.simulations,
+            'timers': {name: {'seconds': seconds, 'calls': calls} for name, (seconds, calls) in self.timers.items()},
+            'counters': dict(self.counters),
+            'peaks': dict(self.peaks),
+            'profile': self.profile_stats,
+        }
+
+    # Add the measurements of another simulation (or a whole report) to this one
+    def merge(self, snapshot):
+        self.simulations += snapshot['simulations']
+        for name, timer in snapshot['timers'].items():
+            total = self.timers.setdefault(name, [0.0, 0])
+            total[0] += timer['seconds']
+            total[1] += timer['calls']
+        for name, value in snapshot['counters'].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        for name, value in snapshot['peaks'].items():
+            self.peaks[name] = max(self.peaks.get(name, value), value)
+        if snapshot.get('profile'):
+            if self.profile_stats is None:
+                self.profile_stats = pstats.Stats(_ProfileStats(snapshot['profile']))
+            else:
+                self.profile_stats.add(_ProfileStats(snapshot['profile']))
+
+    # Write the aggregated report as JSON, and the merged cProfile (for pstats/snakeviz) next to it
+    def export(self, path, profile_path=None):
+        report = self.snapshot()
+        report.pop('profile')
+        report['timers'] = {name: {**timer, 'seconds_per_simulation': timer['seconds'] / max(1, self.simulations)}
+                            for name, timer in report['timers'].items()}
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        if profile_path and isinstance(self.profile_stats, pstats.Stats):
+            self.profile_stats.dump_stats(profile_path)
+        return report
+
+
+# Phase times per simulation, largest first, then the counters and peaks
+def print_report(report):
+    simulations = max(1, report['simulations'])
+    print(f"\n--- INSTRUMENTATION ({report['simulations']} simulations) ---")
+    for name, timer in sorted(report['timers'].items(), key=lambda item: -item[1]['seconds']):
+        print(f"{name}: {timer['seconds']:.3f} s total, {timer['seconds_per_simulation'] * 1e3:.3f} ms per simulation, {timer['calls']} calls")
+    for name, value in report['counters'].items():
+        print(f"{name}: {value} ({value / simulations:.1f} per simulation)")
+    counters = report['counters']
+    if counters.get('slots'):
+        print(f"passes per slot: {counters.get('passes', 0) / counters['slots']:.2f}")
+    for name, value in report['peaks'].items():
+        print(f"{name}: {value} (largest)")
@@ -0,0 +1,89 @@
+import math
+from statistics import NormalDist
+import numpy as np
+
+# Statistics for Monte Carlo estimates: running means with confidence intervals,
+# antithetic pair averaging and a sequential stopping rule.
+
+CONFIDENCE = 0.95
+MIN_SAMPLES = 30 # Samples required before the normal-approximation interval is trusted
+
+
+# Running mean and variance (Welford's algorithm), one sample at a time
+class RunningStats:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # Sum of squared deviations from the mean
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def extend(self, values):
+        for value in values:
+            self.add(value)
+
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else math.inf
+
+    def std_error(self):
+        return math.sqrt(self.variance() / self.count) if self.count > 1 else math.inf
+
+    # Half width of the normal-approximation confidence interval of the mean
+    def half_width(self, confidence=CONFIDENCE):
+        return NormalDist().inv_cdf(0.5 + confidence / 2) * self.std_error()
+
+    def confidence_interval(self, confidence=CONFIDENCE):
+        half_width = self.half_width(confidence)
+        return self.mean - half_width, self.mean + half_width
+
+    def __str__(self):
+        return f"{self.mean} ± {self.half_width()} (n={self.count})"
+
+
+# Antithetic runs come in pairs whose average is one independent sample;
+# plain runs are passed through. NaN samples (no value for that run) are skipped.
+class SampleStream:
+    def __init__(self, antithetic=False):
+        self.antithetic = antithetic
+        self.stats = RunningStats()
+        self.pending = None
+
+    def add(self, value):
+        if self.antithetic:
+            if self.pending is None:
+                self.pending = value
+                return
+            value, self.pending = (self.pending + value) / 2, None
+        if not np.isnan(value):
+            self.stats.add(value)
+
+    def extend(self, values):
+        for value in values:
+            self.add(value)
+
+
+# Stop once the confidence interval of the mean is narrower than +-tolerance
+# (relative to |mean| when relative is set), after at least min_samples samples
+class SequentialStopper:
+    def __init__(self, tolerance, confidence=CONFIDENCE, relative=False, min_samples=MIN_SAMPLES):
+        self.tolerance = tolerance
+        self.confidence = confidence
+        self.relative = relative
+        self.min_samples = min_samples
+
+    def should_stop(self, stats):
+        if self.tolerance is None or stats.count < self.min_samples:
+            return False
+        limit = self.tolerance * abs(stats.mean) if self.relative else self.tolerance
+        return stats.half_width(self.confidence) <= limit
+
+
+# Summary of a results column; antithetic pairs are averaged first
+def summarize(values, antithetic=False):
+    stream = SampleStream(antithetic)
+    stream.extend(np.asarray(values, dtype=np.float64))
+    return stream.stats
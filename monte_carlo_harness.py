@@ -0,0 +1,264 @@
+import numpy as np
+from traffic_simulator import TrafficSimulator
+from trace_traffic import TraceTraffic
+from decay_sweep import decay_sweep, adaptive_decay_search
+from advertiser_data import load_advertiser_data
+from parallel_runner import iter_parallel, campaign_seed, TRAFFIC_STREAM
+from results_store import ResultsWriter, read_results, store_exists
+from mc_statistics import SampleStream, SequentialStopper, CONFIDENCE
+from instrumentation import Instrumentation, print_report
+from event_recorder import EventRecorder, OFF
+from simulation_engine import Advertiser, Strategy, run_bidding, get_estimated_impressions
+
+# Bidding simulator and Monte Carlo campaign shared by monte_carlo.py and monte_carlo_ratio.py.
+# A campaign samples advertisers and traffic, searches the revenue-vs-decay curve of every sample
+# and streams the results to a resumable store; score_sample adds a module's own result columns.
+
+#default simulation hyperparameters
+NUM_TIME_SLOTS = 24
+MIN_IMPRESSIONS = 100
+MAX_IMPRESSIONS = 500
+PEAK_START = 9
+PEAK_END = 17
+PEAK_AMPLITUDE = 1.2
+TRAFFIC_TRACE = None # Path of a recorded traffic trace (.npy) to replay instead of synthetic traffic
+DECAY_RATE = 0.01
+ALPHA = 0.7
+BETA = 0.15
+GPG_METHOD = "block" # "block" draws every perturbation, "multinomial" samples winners from win probabilities
+SLOT_ALLOCATION = "water_filling" # "water_filling" splits each slot in closed form, "passes" hands out truncated estimates pass after pass
+MASTER_SEED = None # None draws fresh entropy, which is printed so the run can be repeated
+NUM_WORKERS = None # None uses every core
+DECAY_FACTORS = np.arange(0, 1.01, 0.01) # Decay factors tried in every simulation
+DECAY_SEARCH = "grid" # "grid" evaluates every decay factor, "adaptive" refines a coarse grid around the best and can miss narrow peaks
+DECAY_COARSE_STRIDE = 20 # Adaptive search starts from every 20th decay factor; 1 is the full grid
+DECAY_REFINE_KEEP = 1 # Adaptive search refines around this many of the best revenues seen
+RESULTS_PATH = 'monte_carlo_results' # Columnar results store (a directory)
+RESULTS_BATCH_SIZE = 256 # Results buffered before each append to the store; every append is a checkpoint
+RESUME = False # Continue an interrupted run from the results store instead of starting over
+PREGENERATE_TRAFFIC = True # Draw the whole campaign's traffic up front in batches, shared by every worker
+TRAFFIC_BLOCK = 1024 # Runs of traffic drawn per batch (even, so antithetic pairs stay in one block)
+ANTITHETIC = False # Simulate runs in pairs with mirrored traffic; pair averages are the samples
+TOLERANCE = None # Stop once the confidence interval of TARGET_METRIC is within +-TOLERANCE; None runs every simulation
+TARGET_METRIC = 'max_reward' # Result column the stopping rule watches
+INSTRUMENT = False # Time the simulation phases and count loop passes, GPG calls and satisfactions
+PROFILE = False # Also capture a cProfile of every simulation
+TRACE_MEMORY = False # Also record every simulation's peak traced memory (tracemalloc)
+INSTRUMENTATION_FILE = 'instrumentation.json' # Timers and counters summed over the campaign
+PROFILE_FILE = 'profile.prof' # cProfile merged over the campaign, for pstats or snakeviz
+EVENT_LEVEL = OFF # GPG blocks are kept in an in-memory event ring at this level instead of printed
+
+#class to simulate the bidding process
+class BiddingSimulator:
+    def __init__(self, min_impressions=MIN_IMPRESSIONS, max_impressions=MAX_IMPRESSIONS,
+                    peak_start=PEAK_START, peak_end=PEAK_END, peak_amplitude=PEAK_AMPLITUDE,
+                    decay_rate=DECAY_RATE, alpha=ALPHA, beta=BETA, traffic_trace=TRAFFIC_TRACE):
+        self.min_impressions = min_impressions
+        self.max_impressions = max_impressions
+        self.peak_start = peak_start
+        self.peak_end = peak_end
+        self.peak_amplitude = peak_amplitude
+        self.decay_rate = decay_rate
+        self.alpha = alpha
+        self.beta = beta
+        if traffic_trace:
+            self.traffic = TraceTraffic(traffic_trace)
+        else:
+            self.traffic = TrafficSimulator(min_impressions, max_impressions, peak_start, peak_end, peak_amplitude)
+        self.run_gpg = True
+        self.rng = np.random.default_rng()
+        self.gpg_method = GPG_METHOD
+        self.slot_allocation = SLOT_ALLOCATION
+        self.instrumentation = Instrumentation() # Disabled unless a campaign turns it on
+        self.events = EventRecorder(level=EVENT_LEVEL)
+
+    def init_advertisers(self):
+        return {
+            "A": Advertiser("A", 25, 250, 20000, 100),
+            "B": Advertiser("B", 24, 240, 15000, 100),
+            "C": Advertiser("C", 12, 125, 10000, 50),
+            "D": Advertiser("D", 30, 150, 5000, 0)
+        }
+
+    # Runs the shared engine with this simulator's decay rate, GPG settings and random stream;
+    # an AdvertiserPool takes the array path and is updated in place
+    def simulate_bidding(self, advertisers, num_time_slots, initial_impression_estimate, actual_impressions):
+        estimated_impressions = get_estimated_impressions(actual_impressions, initial_impression_estimate, self.alpha)
+        strategy = Strategy(self.decay_rate, self.beta, self.gpg_method, self.rng, slot_allocation=self.slot_allocation)
+        return run_bidding(advertisers, num_time_slots, actual_impressions, estimated_impressions, strategy, self.run_gpg,
+                           self.events, self.instrumentation)
+
+    def run_simulation(self, num_time_slots=NUM_TIME_SLOTS, initial_impression_estimate=2500, custom_advertisers=None, run_gpg=True, decay_rate=DECAY_RATE, actual_impressions=None):
+        advertisers = custom_advertisers if custom_advertisers else self.init_advertisers()
+        self.decay_rate = decay_rate
+        self.run_gpg = run_gpg
+        total_revenue = self.simulate_bidding(advertisers, num_time_slots, initial_impression_estimate, actual_impressions)
+        return total_revenue, advertisers
+
+    # Revenue for every decay factor at once (GPG disabled), one entry per decay factor
+    def run_decay_sweep(self, decay_factors, num_time_slots=NUM_TIME_SLOTS, initial_impression_estimate=2500, custom_advertisers=None, actual_impressions=None):
+        advertisers = custom_advertisers if custom_advertisers else self.init_advertisers()
+        estimated_impressions = get_estimated_impressions(actual_impressions, initial_impression_estimate, self.alpha)
+        return decay_sweep(advertisers, actual_impressions, estimated_impressions, decay_factors, num_time_slots, self.instrumentation,
+                           self.slot_allocation)
+
+#class to run a Monte Carlo campaign; subclasses add their own result columns through score_sample
+class MonteCarloHarness:
+    def __init__(self, bidding_simulator=None):
+        self.bidding_simulator = bidding_simulator or BiddingSimulator()
+        self.advertiser_data = None
+        self.campaign_traffic = None
+        self.instrumentation = self.bidding_simulator.instrumentation
+
+    # Sampled dataset rows and the pool they form, drawn from the sample's stream
+    def sample_advertisers(self, rng, min_adv, max_adv):
+        with self.instrumentation.timer('advertiser_sampling'):
+            sampled_rows = self.advertiser_data.sample_rows(int(rng.integers(min_adv, max_adv + 1)), rng)
+            # Sampled rows become one struct-of-arrays pool, reset between runs instead of deep-copied
+            return sampled_rows, self.advertiser_data.pool(sampled_rows)
+
+    # Traffic of simulation `index`: its pre-generated row, else drawn from the sample's stream
+    def sample_traffic(self, index, rng):
+        if self.campaign_traffic is not None:
+            return self.campaign_traffic[index]
+        return self.bidding_simulator.traffic.get_actual_impressions(NUM_TIME_SLOTS, rng=rng)
+
+    # Run one Monte Carlo sample; every random draw comes from its own seed stream
+    def run_single_simulation(self, index, seed_sequence, min_adv=100, max_adv=500, vectorized=True, decay_search=DECAY_SEARCH, **options):
+        #print(f"\n---MONTE CARLO SIMULATION #{index+1}---")
+        rng = np.random.default_rng(seed_sequence)
+        sampled_rows, converted_advertisers = self.sample_advertisers(rng, min_adv, max_adv)
+        actual_impressions = self.sample_traffic(index, rng)
+
+        # Revenue-vs-decay curve, NaN at decay factors the adaptive search skipped
+        decay_factor_range = DECAY_FACTORS
+        evaluate = lambda indices: self.evaluate_decay_factors(converted_advertisers, actual_impressions, decay_factor_range[indices], vectorized)
+        with self.instrumentation.timer('decay_search'):
+            if decay_search == "adaptive":
+                decay_curve, evaluations = adaptive_decay_search(evaluate, len(decay_factor_range), DECAY_COARSE_STRIDE, DECAY_REFINE_KEEP)
+            else:
+                decay_curve, evaluations = evaluate(np.arange(len(decay_factor_range))), len(decay_factor_range)
+        self.instrumentation.count('decay_evaluations', evaluations)
+        best_decay_factor, max_reward = self.best_decay(decay_curve)
+
+        result = {
+            'advertiser_ids': self.advertiser_data['AdvertiserId'][sampled_rows].tolist(),
+            'best_decay_factor': best_decay_factor,
+            'max_reward': max_reward,
+            'decay_curve': decay_curve,
+            'decay_evaluations': evaluations,
+        }
+        result.update(self.score_sample(index, rng, converted_advertisers, actual_impressions, result, **options))
+        return result
+
+    # Best decay factor and its revenue; ties go to the largest decay factor
+    def best_decay(self, decay_curve):
+        best_index = len(decay_curve) - 1 - np.nanargmax(decay_curve[::-1])
+        return DECAY_FACTORS[best_index], decay_curve[best_index]
+
+    # Extra result columns of one sample, computed after the decay search; none here
+    def score_sample(self, index, rng, pool, actual_impressions, result, **options):
+        return {}
+
+    # run_single_simulation under the instrumentation; its measurements travel back with the result
+    def run_instrumented_simulation(self, index, seed_sequence, **kwargs):
+        result, measurements = self.instrumentation.capture(self.run_single_simulation, index, seed_sequence, **kwargs)
+        result['instrumentation'] = measurements
+        return result
+
+    # Revenue at the given decay factors (GPG disabled): one sweep when vectorized, else one run_simulation each
+    def evaluate_decay_factors(self, pool, actual_impressions, decay_factors, vectorized=True):
+        if vectorized:
+            return self.bidding_simulator.run_decay_sweep(decay_factors, custom_advertisers=pool, actual_impressions=actual_impressions)
+        rewards = []
+        for decay_factor in decay_factors:
+            #print(f"\nDecay Factor: {decay_factor}")
+            pool.reset()
+            reward, simulated_advertisers = self.bidding_simulator.run_simulation(custom_advertisers=pool, run_gpg=False, decay_rate=decay_factor, actual_impressions=actual_impressions)
+            rewards.append(reward)
+        return np.array(rewards)
+
+    # Traffic of simulations [0, num_simulations), one row each, drawn TRAFFIC_BLOCK runs at a time.
+    # Each block has its own seed, so a row does not depend on num_simulations.
+    def generate_traffic(self, num_simulations, master_seed, antithetic=False):
+        traffic = self.bidding_simulator.traffic
+        blocks = [traffic.get_actual_impressions_batch(TRAFFIC_BLOCK, NUM_TIME_SLOTS, rng=np.random.default_rng(campaign_seed(master_seed, TRAFFIC_STREAM, block)), antithetic=antithetic)
+                  for block in range(-(-num_simulations // TRAFFIC_BLOCK))]
+        return np.concatenate(blocks)[:num_simulations]
+
+    # Columns of the results store; ids are ragged, the decay curve has one value per decay factor
+    def result_columns(self, **options):
+        return {
+            'advertiser_ids': (np.int32, None),
+            'best_decay_factor': (np.float64, 1),
+            'max_reward': (np.float64, 1),
+            'decay_curve': (np.float64, len(DECAY_FACTORS)),
+            'decay_evaluations': (np.int64, 1),
+        }
+
+    # Runs the given number of samples (or until the target metric is within +-tolerance), passing the
+    # options on to score_sample and result_columns; a resumed run must have been started with the same settings
+    def run_monte_carlo(self, num_simulations=10000, min_adv=100, max_adv=500, vectorized=True, seed=None, workers=None, output=RESULTS_PATH, resume=False, pregenerate_traffic=PREGENERATE_TRAFFIC, decay_search=DECAY_SEARCH,
+                        antithetic=ANTITHETIC, tolerance=TOLERANCE, target=TARGET_METRIC, confidence=CONFIDENCE,
+                        instrument=INSTRUMENT, profile=PROFILE, trace_memory=TRACE_MEMORY, **options):
+        if antithetic and not pregenerate_traffic:
+            raise ValueError("Antithetic runs need pre-generated traffic")
+        # Load the advertiser dataset
+        self.advertiser_data = load_advertiser_data()
+
+        settings = {'min_adv': min_adv, 'max_adv': max_adv, 'vectorized': vectorized, 'decay_search': decay_search, 'pregenerate_traffic': pregenerate_traffic,
+                    'traffic_trace': getattr(self.bidding_simulator.traffic, 'path', None), 'antithetic': antithetic, **options,
+                    'gpg_method': self.bidding_simulator.gpg_method, 'slot_allocation': self.bidding_simulator.slot_allocation, 'decay_factors': DECAY_FACTORS.tolist()}
+
+        if resume and store_exists(output):
+            # Each simulation's seed depends only on the master seed and its index, so the checkpoint
+            # needs just the master entropy and the number of finished simulations
+            writer = ResultsWriter(output, batch_size=RESULTS_BATCH_SIZE, resume=True)
+            checkpoint = writer.schema['metadata']
+            if checkpoint['settings'] != settings:
+                raise ValueError(f"Cannot resume {output}: it was run with {checkpoint['settings']}, not {settings}")
+            master_seed = np.random.SeedSequence(checkpoint['entropy'])
+            print(f"Resuming at simulation {writer.rows + 1} with master seed: {master_seed.entropy}")
+        else:
+            # All per-simulation seed streams derive from this master seed
+            master_seed = np.random.SeedSequence(seed)
+            print(f"Master seed: {master_seed.entropy}")
+            writer = ResultsWriter(output, self.result_columns(**options), batch_size=RESULTS_BATCH_SIZE,
+                                   metadata={'entropy': master_seed.entropy, 'settings': settings})
+
+        # Traffic is drawn once here and shipped to the workers with the simulation
+        self.campaign_traffic = self.generate_traffic(num_simulations, master_seed, antithetic) if pregenerate_traffic else None
+
+        # Confidence interval of the target metric, including results already in a resumed store
+        samples = SampleStream(antithetic)
+        samples.extend(read_results(output)[target])
+        stopper = SequentialStopper(tolerance, confidence)
+
+        # Instrumentation is configured here and shipped to the workers with the simulation;
+        # every result brings back its own measurements, summed into one report
+        self.instrumentation.enabled = instrument or profile or trace_memory
+        self.instrumentation.profile = profile
+        self.instrumentation.trace_memory = trace_memory
+        task = "run_instrumented_simulation" if self.instrumentation.enabled else "run_single_simulation"
+        report = Instrumentation()
+
+        # Run Monte Carlo simulation over a process pool, streaming results to the store in batches;
+        # finished results are flushed on the way out even if the run is interrupted
+        with writer:
+            for result in iter_parallel(self, num_simulations, master_seed, workers=workers, start=writer.rows, task=task,
+                                        min_adv=min_adv, max_adv=max_adv, vectorized=vectorized, decay_search=decay_search, **options):
+                if 'instrumentation' in result:
+                    report.merge(result.pop('instrumentation'))
+                writer.append(result)
+                samples.add(np.nan if result[target] is None else result[target])
+                # Only stop on whole antithetic pairs
+                if samples.pending is None and stopper.should_stop(samples.stats):
+                    print(f"\n{target} = {samples.stats} is within +-{tolerance}, stopping after {writer.rows + len(writer.buffer)} simulations")
+                    break
+
+        if self.instrumentation.enabled:
+            print_report(report.export(INSTRUMENTATION_FILE, PROFILE_FILE if profile else None))
+            print(f"Instrumentation saved to {INSTRUMENTATION_FILE}" + (f", profile to {PROFILE_FILE}" if profile else ""))
+
+        print(f"\nMonte Carlo simulation completed. Results saved to {output}.")
+        return read_results(output)
@@ -0,0 +1,139 @@
+import math
+import numpy as np
+
+# Offline optimum for the competitive ratio.
+# Meeting an advertiser's minimum is a 0/1 knapsack item: weight is the minimum
+# impressions, value is min * bid + reward, capacity is the total impressions.
+
+MAX_DP_CELLS = 200_000_000 # Above this many (items x capacity) cells, fall back to branch and bound
+
+
+# Dynamic programming over capacities; O(n * capacity) time, keeps one bit per cell for reconstruction
+def knapsack_dp(weights, values, capacity):
+    weights = np.asarray(weights, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    # Only multiples of the common divisor of the weights are reachable
+    divisor = int(np.gcd.reduce(weights)) if weights.size and weights.any() else 1
+    weights = weights // divisor
+    capacity = int(capacity) // divisor
+
+    best = np.zeros(capacity + 1)
+    taken_bits = np.zeros((weights.size, (capacity + 8) // 8), dtype=np.uint8)
+    for k in range(weights.size):
+        weight, value = int(weights[k]), values[k]
+        if weight > capacity or value <= 0:
+            continue
+        candidate = best[:capacity + 1 - weight] + value
+        take = candidate > best[weight:]
+        best[weight:][take] = candidate[take]
+        taken = np.zeros(capacity + 1, dtype=bool)
+        taken[weight:] = take
+        taken_bits[k] = np.packbits(taken)
+
+    chosen = []
+    remaining = capacity
+    for k in range(weights.size - 1, -1, -1):
+        if taken_bits[k, remaining >> 3] & (0x80 >> (remaining & 7)):
+            chosen.append(k)
+            remaining -= int(weights[k])
+    chosen.reverse()
+    return best[capacity], chosen
+
+
+# Depth-first branch and bound in density order, pruned by the fractional (LP) bound
+def knapsack_branch_and_bound(weights, values, capacity):
+    weights = np.asarray(weights, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    usable = np.flatnonzero((weights <= capacity) & (values > 0))
+    free = usable[weights[usable] == 0]
+    usable = usable[weights[usable] > 0]
+    order = usable[np.argsort(-(values[usable] / weights[usable]), kind="stable")]
+    w = weights[order].tolist()
+    v = values[order].tolist()
+    n = len(order)
+    prefix_w = np.concatenate(([0], np.cumsum(weights[order]))).tolist()
+    prefix_v = np.concatenate(([0.0], np.cumsum(values[order]))).tolist()
+    integral = bool(np.all(values == np.round(values)))
+
+    def upper_bound(i, cap, value):
+        # Greedy fill from item i on, then a fraction of the first item that does not fit
+        target = prefix_w[i] + cap
+        lo, hi = i, n
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if prefix_w[mid] <= target:
+                lo = mid
+            else:
+                hi = mid - 1
+        bound = value + prefix_v[lo] - prefix_v[i]
+        if lo < n:
+            bound += (target - prefix_w[lo]) * v[lo] / w[lo]
+        return math.floor(bound + 1e-9) if integral else bound
+
+    best_value, best_chosen = 0.0, None
+    stack = [(0, int(capacity), 0.0, None)]
+    while stack:
+        i, cap, value, chosen = stack.pop()
+        if value > best_value:
+            best_value, best_chosen = value, chosen
+        if i == n or upper_bound(i, cap, value) <= best_value:
+            continue
+        # Skip branch is pushed first so the take branch is explored first
+        stack.append((i + 1, cap, value, chosen))
+        if w[i] <= cap:
+            stack.append((i + 1, cap - w[i], value + v[i], (i, chosen)))
+
+    chosen = []
+    while best_chosen is not None:
+        chosen.append(int(order[best_chosen[0]]))
+        best_chosen = best_chosen[1]
+    chosen.extend(int(k) for k in free if values[k] > 0)
+    return best_value + values[free].sum(), sorted(chosen)
+
+
+# Exact optimum; dynamic programming when the table fits, branch and bound otherwise
+def solve_knapsack(weights, values, capacity, max_dp_cells=MAX_DP_CELLS):
+    weights = np.asarray(weights, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if weights.sum() <= capacity:
+        chosen = np.flatnonzero(values > 0).tolist()
+        return values[chosen].sum(), chosen
+    divisor = int(np.gcd.reduce(weights)) if weights.any() else 1
+    if weights.size * (int(capacity) // divisor + 1) <= max_dp_cells:
+        return knapsack_dp(weights, values, capacity)
+    return knapsack_branch_and_bound(weights, values, capacity)
+
+
+# Fractional (LP relaxation) upper bound and a feasible greedy lower bound, O(n log n).
+# The lower bound is the better of the density-greedy packing and the best single item.
+def knapsack_bounds(weights, values, capacity):
+    weights = np.asarray(weights, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    usable = np.flatnonzero((weights <= capacity) & (values > 0))
+    if usable.size == 0:
+        return 0.0, 0.0, []
+    density = np.where(weights[usable] > 0, values[usable] / np.maximum(weights[usable], 1), np.inf)
+    order = usable[np.argsort(-density, kind="stable")]
+
+    # Upper bound: whole items in density order, then a fraction of the first that does not fit
+    prefix_w = np.cumsum(weights[order])
+    prefix_v = np.cumsum(values[order])
+    split = int(np.searchsorted(prefix_w, capacity, side="right"))
+    upper = prefix_v[split - 1] if split > 0 else 0.0
+    if split < order.size:
+        used = prefix_w[split - 1] if split > 0 else 0
+        upper += (capacity - used) * values[order[split]] / weights[order[split]]
+
+    # Lower bound: keep scanning past items that do not fit
+    chosen = []
+    room = int(capacity)
+    lower = 0.0
+    for k in order.tolist():
+        if weights[k] <= room:
+            chosen.append(k)
+            room -= int(weights[k])
+            lower += values[k]
+    single = int(usable[np.argmax(values[usable])])
+    if values[single] > lower:
+        lower, chosen = values[single], [single]
+    return float(upper), float(lower), sorted(chosen)
@@ -0,0 +1,64 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+# Process-pool runner for Monte Carlo simulations.
+# Every simulation gets its own seed stream, derived from the master seed and the
+# simulation index only, so results do not depend on the worker count or scheduling.
+
+CAMPAIGN_STREAM = 2**32 - 1 # Spawn-key word reserved for campaign-wide streams; simulation indices never reach it
+TRAFFIC_STREAM = 0 # Campaign stream of pre-generated traffic
+
+_worker_simulation = None
+_worker_task = None
+_worker_kwargs = None
+
+
+# Seed stream of one simulation: child `index` of the master seed sequence
+def simulation_seed(master_seed, index):
+    root = master_seed if isinstance(master_seed, np.random.SeedSequence) else np.random.SeedSequence(master_seed)
+    return np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (index,))
+
+
+# Seed of block `block` of a campaign-wide stream, drawn once for many simulations at a time
+def campaign_seed(master_seed, stream, block):
+    root = master_seed if isinstance(master_seed, np.random.SeedSequence) else np.random.SeedSequence(master_seed)
+    return np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (CAMPAIGN_STREAM, stream, block))
+
+
+def _init_worker(simulation, task, kwargs):
+    global _worker_simulation, _worker_task, _worker_kwargs
+    _worker_simulation = simulation
+    _worker_task = task
+    _worker_kwargs = kwargs
+
+
+def _run_task(item):
+    index, seed_sequence = item
+    return getattr(_worker_simulation, _worker_task)(index, seed_sequence, **_worker_kwargs)
+
+
+# Run simulation.<task>(index, seed_sequence, **kwargs) for every index in [start, num_simulations)
+# and yield the results in index order as they finish
+def iter_parallel(simulation, num_simulations, master_seed, workers=None, start=0, desc="Running simulations",
+                  task="run_single_simulation", **kwargs):
+    workers = workers or os.cpu_count() or 1
+    tasks = [(i, simulation_seed(master_seed, i)) for i in range(start, num_simulations)]
+    if workers == 1 or len(tasks) <= 1:
+        _init_worker(simulation, task, kwargs)
+        yield from (_run_task(item) for item in tqdm(tasks, desc=desc))
+        return
+
+    chunksize = max(1, len(tasks) // (workers * 8))
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(simulation, task, kwargs))
+    try:
+        yield from tqdm(executor.map(_run_task, tasks, chunksize=chunksize), total=len(tasks), desc=desc)
+    finally:
+        # Drop queued work if the caller stops early (interrupted, stopping rule met, or an error while saving)
+        executor.shutdown(cancel_futures=True)
+
+
+# Same as iter_parallel, collected into a list
+def run_parallel(simulation, num_simulations, master_seed, workers=None, start=0, desc="Running simulations", **kwargs):
+    return list(iter_parallel(simulation, num_simulations, master_seed, workers=workers, start=start, desc=desc, **kwargs))
@@ -0,0 +1,87 @@
+import math
+import heapq
+import numpy as np
+
+# Fractional partial allocation (PartialAllocation in main.go) for the Python simulators.
+# Each arrival is split across advertisers: the one with the highest bid * (1 - g(t) * y) takes as
+# much of it as its budget allows, then the next one, until the arrival is used up. y ~ U(0, 1) is
+# drawn once per advertiser and g(t) = exp(beta * (t - 1)) with t the fraction of the run elapsed.
+# Keys only change with t, so the advertisers sit in a priority heap rebuilt once per time slot;
+# exhausted budgets are popped lazily when they reach the top, and an arrival split into k pieces
+# costs O(k log n).
+
+BETA = 0.15
+
+
+class PartialAllocation:
+    # capacity is how many impressions each advertiser's budget pays for, fractions included
+    def __init__(self, bids, capacity, beta=BETA, rng=None):
+        rng = rng if rng is not None else np.random.default_rng()
+        self.bids = np.asarray(bids, dtype=np.float64)
+        self.room = np.array(capacity, dtype=np.float64) # Impressions each budget still pays for
+        self.allocated = np.zeros(self.bids.size) # Fractional impressions won
+        self.y = rng.random(self.bids.size)
+        self.beta = beta
+        self.heap = []
+
+    def g(self, t):
+        return math.exp(self.beta * (t - 1))
+
+    # Key the heap for arrivals at time t in [0, 1]
+    def start(self, t):
+        values = self.bids * (1 - self.g(t) * self.y)
+        candidates = np.flatnonzero((self.bids > 0) & (self.room > 0))
+        self.heap = list(zip((-values[candidates]).tolist(), candidates.tolist()))
+        heapq.heapify(self.heap)
+
+    # Place `amount` impressions with the best advertisers in turn; returns the (advertiser, fraction)
+    # pieces. Whatever no budget can pay for is left unplaced.
+    def place(self, amount):
+        pieces = []
+        heap, room = self.heap, self.room
+        while amount > 0 and heap:
+            advertiser = heap[0][1]
+            if room[advertiser] <= 0:
+                # Exhausted since the heap was keyed
+                heapq.heappop(heap)
+                continue
+            take = min(amount, float(room[advertiser]))
+            self.allocated[advertiser] += take
+            room[advertiser] -= take
+            amount -= take
+            pieces.append((advertiser, take))
+            if room[advertiser] <= 0:
+                heapq.heappop(heap)
+        return pieces
+
+    # One arrival, split across advertisers
+    def process_arrival(self):
+        return self.place(1.0)
+
+    # A slot's arrivals at once: consecutive arrivals fill the same heap order, so they are the
+    # same pieces as processing them one by one, merged per advertiser. Returns the impressions placed.
+    def serve(self, num_arrivals):
+        return sum(take for _, take in self.place(float(num_arrivals)))
+
+    def revenue(self):
+        return float(np.dot(self.bids, self.allocated))
+
+
+# Revenue of the partial allocation over a run, one heap per time slot
+def partial_allocation_revenue(bids, capacity, actual_impressions, beta=BETA, rng=None):
+    allocation = PartialAllocation(bids, capacity, beta, rng)
+    num_time_slots = len(actual_impressions)
+    for time_slot, arrivals in enumerate(actual_impressions):
+        allocation.start((time_slot + 1) / num_time_slots)
+        allocation.serve(arrivals)
+    return allocation.revenue()
+
+
+# Offline optimum of the same fractional problem: the highest bids fill their budgets first
+def optimal_fractional_revenue(bids, capacity, total_impressions):
+    bids = np.asarray(bids, dtype=np.float64)
+    order = np.argsort(-bids, kind="stable")
+    room = np.maximum(np.asarray(capacity, dtype=np.float64)[order], 0.0)
+    filled_before = np.cumsum(room) - room
+    taken = np.clip(total_impressions - filled_before, 0.0, room)
+    return float(np.dot(bids[order], taken))
@@ -0,0 +1,418 @@
+import time
+import json
+import asyncio
+from collections import deque
+import numpy as np
+from traffic_simulator import TrafficSimulator
+from simulation_engine import allocate, check_satisfaction
+from bidding_with_unknown_impressions_realtime import (init_advertisers, STRATEGY, ALPHA, NUM_TIME_SLOTS,
+                                                       MIN_IMPRESSIONS, MAX_IMPRESSIONS, PEAK_START, PEAK_END, PEAK_AMPLITUDE)
+
+# Asyncio impression-serving front end for the realtime allocator.
+# Requests are newline-delimited JSON over a local TCP socket: {"id": 1, "slot": 3} is answered
+# with {"id": 1, "advertiser": "B"} (null when the impression goes unsold), {"stats": true}
+# with the server's decision count and p50/p99 decision time. A line that is not a valid request
+# is answered at once with {"error": "..."} and the connection carries on.
+# Connections are read ahead of their answers, so a client may pipeline requests; answers are
+# written as they are decided. With micro-batching, pending requests are resolved together in one
+# vectorized step when BATCH_SIZE of them are waiting or the oldest nears DECISION_DEADLINE.
+
+MODE = "bench" # "serve" runs the server until interrupted, "bench" also drives it with the load generator
+HOST = "127.0.0.1"
+PORT = 8765 # 0 picks a free port
+INITIAL_IMPRESSION_ESTIMATE = 2500
+RUN_GPG = True
+DECISION_DEADLINE = 0.001 # Decision time (seconds) above which a decision counts as a deadline miss
+LATENCY_WINDOW = 100_000 # Most recent decisions kept for the latency percentiles
+CONCURRENCY = 32 # Connections the load generator keeps busy
+PIPELINE_DEPTH = 1 # Requests each load generator connection keeps in flight; 1 waits for every answer
+BATCHING = False # Resolve requests in micro-batches instead of one at a time
+BATCH_SIZE = 256 # A micro-batch is resolved as soon as it holds this many requests
+DEADLINE_SLACK = 0.0002 # ... or this many seconds, plus the batch's expected decision time, before its oldest request misses DECISION_DEADLINE
+BATCH_COST_SMOOTHING = 0.1 # Weight of the latest batch in the running decision time per request
+LAG_DECAY = 0.01 # Decay of the loop lag estimate per sample
+READ_CHUNK = 65536 # Bytes read from a connection at once; the batcher is polled after each chunk
+
+
+# The realtime allocator's per-slot logic, one impression at a time.
+# Within a slot, impressions go to the remaining advertisers in priority order, each up to its
+# estimated allocation for the slot; when every quota is used up a fresh pass starts. Unlike
+# run_bidding, which keeps the slot's estimate and indexes it by list position as advertisers drop
+# out, every fresh pass re-estimates the allocation for the advertisers still short of their
+# minimum and keys the quotas by name, so the two can split a slot differently. Once every minimum
+# is met, impressions go through GPG.
+class OnlineAllocator:
+    def __init__(self, advertisers, initial_impression_estimate=INITIAL_IMPRESSION_ESTIMATE, run_gpg=RUN_GPG, strategy=STRATEGY):
+        self.advertisers = advertisers
+        self.strategy = strategy
+        self.remaining_advertisers = strategy.order(advertisers, 0)
+        self.run_gpg = run_gpg
+        self.time_slot = 0
+        self.estimated = initial_impression_estimate
+        self.slot_impressions = 0 # Impressions seen in the current slot
+        self.decisions = 0
+        self.new_pass()
+
+    # Move to a later slot; the estimate is updated as in get_estimated_impressions, for every slot passed
+    def start_slot(self, time_slot):
+        while self.time_slot < time_slot:
+            self.estimated = int(ALPHA * self.slot_impressions + (1 - ALPHA) * self.estimated)
+            self.slot_impressions = 0
+            self.time_slot += 1
+        self.new_pass()
+
+    # Estimated allocation of the slot for the advertisers still short of their minimum
+    def new_pass(self):
+        self.quota = {}
+        if self.remaining_advertisers:
+            allocation = self.strategy.estimated_allocation(self.remaining_advertisers, self.estimated, self.time_slot)
+            self.quota = {adv.name: val for adv, val in zip(self.remaining_advertisers, allocation)}
+        self.position = 0
+
+    # Winner of one impression in time_slot (the current slot when None); None if it goes unsold
+    def decide(self, time_slot=None):
+        # Requests for earlier slots arriving late are served in the current one
+        if time_slot is not None and time_slot > self.time_slot:
+            self.start_slot(time_slot)
+        self.slot_impressions += 1
+        self.decisions += 1
+
+        if self.remaining_advertisers:
+            for fresh_pass in (False, True):
+                if fresh_pass:
+                    self.new_pass()
+                while self.position < len(self.remaining_advertisers):
+                    advertiser = self.remaining_advertisers[self.position]
+                    if self.quota.get(advertiser.name, 0) > 0:
+                        self.quota[advertiser.name] -= 1
+                        allocate(self.remaining_advertisers, self.position, 1)
+                        if advertiser.remaining <= 0:
+                            check_satisfaction(self.remaining_advertisers)
+                        return advertiser.name
+                    self.position += 1
+            # A fresh pass with nothing to hand out: the slot's estimate allocates nothing, like the stall in simulate_bidding
+            return None
+
+        if self.run_gpg:
+            name, bid = self.strategy.gpg(self.advertisers, self.time_slot)
+            if name is not None:
+                self.advertisers[name].allocated += 1
+            return name
+        return None
+
+    # Winners of `count` impressions of the current slot in one step; the minimum phase hands out
+    # whole quotas at a time and GPG places the rest with the block kernel. Same allocation as
+    # calling decide() count times, with the GPG winners in random order.
+    def serve(self, count, rng=None):
+        winners = []
+        fresh_pass = False
+        while count > 0 and self.remaining_advertisers:
+            if self.position >= len(self.remaining_advertisers):
+                if fresh_pass:
+                    # A whole fresh pass handed out nothing, the rest of the batch goes unsold
+                    break
+                self.new_pass()
+                fresh_pass = True
+                continue
+            advertiser = self.remaining_advertisers[self.position]
+            take = min(self.quota.get(advertiser.name, 0), count, advertiser.remaining)
+            if take <= 0:
+                self.position += 1
+                continue
+            fresh_pass = False
+            self.quota[advertiser.name] -= take
+            allocate(self.remaining_advertisers, self.position, take)
+            winners.extend([advertiser.name] * take)
+            count -= take
+            if advertiser.remaining <= 0:
+                check_satisfaction(self.remaining_advertisers)
+            elif self.quota[advertiser.name] <= 0:
+                self.position += 1
+
+        if count > 0 and not self.remaining_advertisers and self.run_gpg:
+            rng = rng if rng is not None else np.random.default_rng()
+            won_by = self.strategy.gpg_block(self.advertisers, count, self.time_slot, rng)
+            gpg_winners = [name for name, won in won_by.items() for _ in range(won)]
+            winners.extend(gpg_winners[i] for i in rng.permutation(len(gpg_winners)))
+            count -= len(gpg_winners)
+        return winners + [None] * count
+
+    # Winners of a batch of impressions given their slots in arrival order
+    def decide_batch(self, slots, rng=None):
+        winners = []
+        start = 0
+        while start < len(slots):
+            slot = slots[start]
+            end = start + 1
+            while end < len(slots) and slots[end] == slot:
+                end += 1
+            if slot is not None and slot > self.time_slot:
+                self.start_slot(slot)
+            self.slot_impressions += end - start
+            self.decisions += end - start
+            winners.extend(self.serve(end - start, rng))
+            start = end
+        return winners
+
+    def total_revenue(self):
+        return sum(advertiser.calculate_revenue() for advertiser in self.advertisers.values())
+
+
+# Decision times of the most recent requests
+class LatencyTracker:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = np.zeros(window)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples[self.count % self.samples.size] = seconds
+        self.count += 1
+
+    def percentiles(self, q=(50, 99)):
+        if self.count == 0:
+            return [0.0] * len(q)
+        return np.percentile(self.samples[:min(self.count, self.samples.size)], q).tolist()
+
+
+# Collects requests into micro-batches and resolves each batch with one decide_batch call.
+# A batch waits for more requests as long as its oldest one can still be answered in time: it is
+# resolved once the oldest has waited the deadline less the slack and the time the batch is
+# expected to take, measured per request over the previous batches. The loop only gets back to a
+# waiting batch after the other connections' work (and timers wake late, as selectors wait in
+# whole milliseconds), so the lag seen between those chances is subtracted as well.
+class MicroBatcher:
+    def __init__(self, server, batch_size=BATCH_SIZE, deadline=DECISION_DEADLINE, slack=DEADLINE_SLACK):
+        self.server = server
+        self.batch_size = batch_size
+        self.deadline = deadline
+        self.slack = slack
+        self.pending = [] # (request, arrival time, future)
+        self.timer = None
+        self.timer_due = 0.0
+        self.batches = 0
+        self.cost = 0.0 # Running decision time per request
+        self.lag = 0.0 # Worst recent wait for the loop to come back to a pending batch, decayed per sample
+        self.polled = 0.0 # When the batcher last had a chance to flush
+
+    # Latest time the pending batch can be resolved and still meet the oldest request's deadline
+    def due(self, size):
+        return self.pending[0][1] + self.deadline - self.slack - self.cost * size
+
+    def wait_seen(self, seconds):
+        self.lag = max(min(seconds, self.deadline), self.lag * (1 - LAG_DECAY))
+
+    def submit(self, request, arrival=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        now = time.perf_counter()
+        self.pending.append((request, now if arrival is None else arrival, future))
+        if len(self.pending) >= self.batch_size or now >= self.due(len(self.pending)):
+            self.flush()
+        elif self.timer is None:
+            # Armed for a full batch, so the batch never outgrows the time left to decide it
+            self.timer_due = self.due(self.batch_size)
+            self.timer = loop.call_later(max(0.0, self.timer_due - self.lag - now), self.expire)
+        return future
+
+    # A connection read everything it had: resolve the batch now if the loop may not come back
+    # to it before its oldest request's deadline
+    def poll(self):
+        now = time.perf_counter()
+        if self.pending:
+            self.wait_seen(now - self.polled)
+            if now + self.lag >= self.due(len(self.pending)):
+                self.flush()
+        self.polled = now
+
+    def expire(self):
+        self.timer = None
+        self.wait_seen(time.perf_counter() - self.timer_due)
+        self.flush()
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        start = time.perf_counter()
+        winners = self.server.allocator.decide_batch([request.get('slot') for request, arrival, future in batch], self.server.rng)
+        done = time.perf_counter()
+        self.server.busy += done - start
+        self.batches += 1
+        self.cost += BATCH_COST_SMOOTHING * ((done - start) / len(batch) - self.cost)
+        for (request, arrival, future), name in zip(batch, winners):
+            # Latency of a batched request includes its wait for the batch to close
+            self.server.record(done - arrival)
+            future.set_result({'id': request.get('id'), 'advertiser': name})
+
+
+# A request line as a dict whose slot, when given, is a non-negative integer; ValueError otherwise
+def parse_request(line):
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError("a request must be a JSON object")
+    slot = request.get('slot')
+    if slot is not None and (type(slot) is not int or slot < 0):
+        raise ValueError("slot must be a non-negative integer")
+    return request
+
+
+class ImpressionServer:
+    def __init__(self, allocator, deadline=DECISION_DEADLINE, batching=BATCHING, batch_size=BATCH_SIZE, slack=DEADLINE_SLACK):
+        self.allocator = allocator
+        self.deadline = deadline
+        self.latency = LatencyTracker()
+        self.deadline_misses = 0
+        self.busy = 0.0 # Seconds spent deciding
+        self.rng = np.random.default_rng()
+        self.batcher = MicroBatcher(self, batch_size, deadline, slack) if batching else None
+        self.server = None
+
+    def record(self, seconds):
+        self.latency.add(seconds)
+        if seconds > self.deadline:
+            self.deadline_misses += 1
+
+    # Decisions run to completion without awaiting, so requests from every connection are serialized
+    def decide(self, request):
+        start = time.perf_counter()
+        name = self.allocator.decide(request.get('slot'))
+        elapsed = time.perf_counter() - start
+        self.busy += elapsed
+        self.record(elapsed)
+        return {'id': request.get('id'), 'advertiser': name}
+
+    def stats(self):
+        p50, p99 = self.latency.percentiles()
+        stats = {
+            'decisions': self.latency.count,
+            'p50_us': p50 * 1e6,
+            'p99_us': p99 * 1e6,
+            'deadline_misses': self.deadline_misses,
+            'decisions_per_second_ceiling': self.latency.count / self.busy if self.busy else 0.0,
+            'revenue': self.allocator.total_revenue(),
+        }
+        if self.batcher is not None:
+            stats['batches'] = self.batcher.batches
+            stats['mean_batch_size'] = self.latency.count / self.batcher.batches if self.batcher.batches else 0.0
+        return stats
+
+    # Requests are read a chunk at a time without waiting for earlier answers, so pipelined
+    # requests of one connection join the same micro-batch; each answer is written when its
+    # decision is made, and decisions are answered in request order
+    async def handle(self, reader, writer):
+        pending = set() # Batched requests of this connection still waiting for their decision
+        respond = lambda future: writer.write((json.dumps(future.result()) + "\n").encode())
+        partial = b"" # Start of a request cut off at the end of the last chunk
+        while chunk := await reader.read(READ_CHUNK):
+            arrival = time.perf_counter()
+            *lines, partial = (partial + chunk).split(b"\n")
+            for line in lines:
+                try:
+                    request = parse_request(line)
+                except ValueError as error:
+                    writer.write((json.dumps({'error': str(error)}) + "\n").encode())
+                    continue
+                if request.get('stats'):
+                    writer.write((json.dumps(self.stats()) + "\n").encode())
+                elif self.batcher is not None:
+                    future = self.batcher.submit(request, arrival)
+                    future.add_done_callback(respond)
+                    future.add_done_callback(pending.discard)
+                    pending.add(future)
+                else:
+                    writer.write((json.dumps(self.decide(request)) + "\n").encode())
+            if self.batcher is not None:
+                self.batcher.poll()
+            await writer.drain()
+        if pending:
+            await asyncio.wait(pending)
+            await writer.drain()
+        writer.close()
+
+    async def start(self, host=HOST, port=PORT):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.batcher is not None:
+            self.batcher.flush()
+        self.server.close()
+        await self.server.wait_closed()
+
+
+# Closed-loop load generator: `concurrency` connections each keep up to `pipeline` requests in
+# flight, sending the next one as soon as an earlier one is answered (pipeline=1 waits for every
+# answer). slots holds the time slot of every request, in order.
+async def generate_load(host, port, slots, concurrency=CONCURRENCY, pipeline=PIPELINE_DEPTH):
+    requests = iter(enumerate(slots))
+    round_trips = []
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        sent = deque() # Send times of the requests in flight; a connection is answered in order
+        while True:
+            while len(sent) < pipeline and (request := next(requests, None)) is not None:
+                request_id, slot = request
+                sent.append(time.perf_counter())
+                writer.write((json.dumps({'id': request_id, 'slot': int(slot)}) + "\n").encode())
+            if not sent:
+                break
+            await writer.drain()
+            await reader.readline()
+            round_trips.append(time.perf_counter() - sent.popleft())
+        writer.close()
+        await writer.wait_closed()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    p50, p99 = np.percentile(round_trips, [50, 99]) if round_trips else (0.0, 0.0)
+    return {
+        'requests': len(round_trips),
+        'seconds': elapsed,
+        'requests_per_second': len(round_trips) / elapsed if elapsed else 0.0,
+        'round_trip_p50_us': p50 * 1e6,
+        'round_trip_p99_us': p99 * 1e6,
+    }
+
+
+async def query_stats(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'{"stats": true}\n')
+    await writer.drain()
+    stats = json.loads(await reader.readline())
+    writer.close()
+    await writer.wait_closed()
+    return stats
+
+
+# One simulated day of traffic, one request per impression
+def traffic_slots(num_time_slots=NUM_TIME_SLOTS):
+    traffic = TrafficSimulator(MIN_IMPRESSIONS, MAX_IMPRESSIONS, PEAK_START, PEAK_END, PEAK_AMPLITUDE)
+    return np.repeat(np.arange(num_time_slots), traffic.get_actual_impressions(num_time_slots))
+
+
+async def run(mode=MODE, host=HOST, port=PORT):
+    server = ImpressionServer(OnlineAllocator(init_advertisers()))
+    port = await server.start(host, port)
+    print(f"Serving impressions on {host}:{port}")
+    if mode == "serve":
+        await server.server.serve_forever()
+        return
+
+    load = await generate_load(host, port, traffic_slots())
+    stats = await query_stats(host, port)
+    await server.close()
+    print("\n--- LOAD TEST SUMMARY ---")
+    for key, value in {**load, **stats}.items():
+        print(f"{key}: {value}")
+
+
+def main():
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
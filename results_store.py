@@ -0,0 +1,176 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# Append-only columnar store for Monte Carlo results.
+# A store is a directory with one raw binary file per column and a schema.json that
+# records the dtype, the width of each row, and how many rows are committed.
+# Columns are either fixed width (width 1 for scalars, e.g. 101 for a decay curve)
+# or ragged (width None, e.g. advertiser ids), stored as values plus row offsets.
+
+SCHEMA_FILE = 'schema.json'
+
+
+def _column_file(path, name, part='values'):
+    return os.path.join(path, f"{name}.{part}.bin")
+
+
+def _write_schema(path, schema):
+    temp_path = os.path.join(path, SCHEMA_FILE + '.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(schema, f, indent=2)
+    os.replace(temp_path, os.path.join(path, SCHEMA_FILE))
+
+
+def store_exists(path):
+    return os.path.exists(os.path.join(path, SCHEMA_FILE))
+
+
+def read_schema(path):
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        return json.load(f)
+
+
+# Streaming results sink; buffers up to batch_size rows and appends them to the column files.
+# Every flush commits its rows to schema.json, so a store is a checkpoint of the finished rows.
+class ResultsWriter:
+    # columns maps a name to (dtype, width), width None for ragged columns; metadata is kept in the schema.
+    # With resume=True an existing store is reopened and appended to instead.
+    def __init__(self, path, columns=None, batch_size=256, metadata=None, resume=False):
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer = []
+        if resume:
+            self.schema = read_schema(path)
+            self._truncate()
+            return
+        os.makedirs(path, exist_ok=True)
+        self.schema = {
+            'rows': 0,
+            'columns': {name: {'dtype': np.dtype(dtype).str, 'width': width} for name, (dtype, width) in columns.items()},
+            'metadata': metadata or {},
+        }
+        for name, column in self.schema['columns'].items():
+            open(_column_file(path, name), 'wb').close()
+            if column['width'] is None:
+                np.zeros(1, dtype=np.int64).tofile(_column_file(path, name, 'offsets'))
+        self._offsets = {name: 0 for name, column in self.schema['columns'].items() if column['width'] is None}
+        _write_schema(path, self.schema)
+
+    # Cut every column file back to the committed rows, dropping a flush that was interrupted halfway
+    def _truncate(self):
+        rows = self.schema['rows']
+        self._offsets = {}
+        for name, column in self.schema['columns'].items():
+            itemsize = np.dtype(column['dtype']).itemsize
+            if column['width'] is None:
+                offsets_file = _column_file(self.path, name, 'offsets')
+                end = int(np.fromfile(offsets_file, dtype=np.int64, count=rows + 1)[rows])
+                os.truncate(offsets_file, (rows + 1) * 8)
+                os.truncate(_column_file(self.path, name), end * itemsize)
+                self._offsets[name] = end
+            else:
+                os.truncate(_column_file(self.path, name), rows * column['width'] * itemsize)
+
+    @property
+    def rows(self):
+        return self.schema['rows']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, result):
+        self.buffer.append(result)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        for name, column in self.schema['columns'].items():
+            dtype = np.dtype(column['dtype'])
+            # Missing values become NaN (an empty row for ragged columns)
+            missing = np.nan if column['width'] == 1 else np.full(column['width'] or 0, np.nan)
+            values = [missing if row.get(name) is None else row[name] for row in self.buffer]
+            with open(_column_file(self.path, name), 'ab') as f:
+                if column['width'] is None:
+                    arrays = [np.asarray(v, dtype=dtype).ravel() for v in values]
+                    np.concatenate(arrays).astype(dtype).tofile(f)
+                    lengths = np.array([a.size for a in arrays], dtype=np.int64)
+                    offsets = self._offsets[name] + np.cumsum(lengths)
+                    self._offsets[name] = int(offsets[-1])
+                    with open(_column_file(self.path, name, 'offsets'), 'ab') as g:
+                        offsets.tofile(g)
+                else:
+                    np.asarray(values, dtype=dtype).reshape(len(values), column['width']).tofile(f)
+        # Rows only count once every column file holds them
+        self.schema['rows'] += len(self.buffer)
+        _write_schema(self.path, self.schema)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+
+# Read-only view of a store; columns are memory-mapped, so nothing is loaded until used
+class ResultsReader:
+    def __init__(self, path):
+        self.path = path
+        self.schema = read_schema(path)
+        self.rows = self.schema['rows']
+
+    def __len__(self):
+        return self.rows
+
+    def columns(self):
+        return list(self.schema['columns'])
+
+    def metadata(self):
+        return self.schema.get('metadata', {})
+
+    def _map(self, file, dtype, count):
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(file, dtype=dtype, mode='r', shape=(count,))
+
+    # Fixed-width columns come back as arrays of shape (rows,) or (rows, width)
+    def __getitem__(self, name):
+        column = self.schema['columns'][name]
+        dtype = np.dtype(column['dtype'])
+        if column['width'] is None:
+            offsets = self._map(_column_file(self.path, name, 'offsets'), np.int64, self.rows + 1)
+            return RaggedColumn(offsets, self._map(_column_file(self.path, name), dtype, int(offsets[-1])))
+        values = self._map(_column_file(self.path, name), dtype, self.rows * column['width'])
+        return values if column['width'] == 1 else values.reshape(self.rows, column['width'])
+
+    # Everything as a DataFrame; wide and ragged columns become one array per row
+    def to_frame(self):
+        frame = {}
+        for name, column in self.schema['columns'].items():
+            values = self[name]
+            frame[name] = list(values) if column['width'] != 1 else np.asarray(values)
+        return pd.DataFrame(frame)
+
+
+# Ragged column: row i is values[offsets[i]:offsets[i + 1]]
+class RaggedColumn:
+    def __init__(self, offsets, values):
+        self.offsets = offsets
+        self.values = values
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return np.asarray(self.values[self.offsets[i]:self.offsets[i + 1]])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def read_results(path):
+    return ResultsReader(path)
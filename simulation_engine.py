@@ -0,0 +1,382 @@
+import math
+import time
+import random
+import numpy as np
+from gpg_kernel import GPG_METHODS
+from advertiser_pool import AdvertiserPool
+from decay_sweep import priority_order, simulate_minimum_phase
+from slot_allocation import water_fill
+from instrumentation import Instrumentation
+from event_recorder import (EventRecorder, OFF, ADVERTISER, SLOT, PREFERENCE, ESTIMATE, ALLOCATION, SATISFACTION,
+                            GPG_ALLOCATION, GPG_EXHAUSTED, SLOT_END)
+
+# Bidding engine shared by every simulator.
+# One core loop runs the minimum-impression phase and then GPG; what differs between the
+# experiments is a Strategy: how advertisers are ordered and given decayed estimates, time
+# multipliers on bids (on the Advertiser), bid adjustment between slots and the GPG variant.
+
+DECAY_RATE = 0.01
+ALPHA = 0.7
+BETA = 0.15
+GPG_METHOD = "block" # "block" draws every perturbation, "multinomial" samples winners from win probabilities
+SLOT_ALLOCATION = "water_filling" # "water_filling" splits each slot in closed form, "passes" hands out truncated estimates pass after pass
+
+NO_EVENTS = EventRecorder(level=OFF) # Default recorder, drops every event
+NO_INSTRUMENTATION = Instrumentation() # Default instrumentation, disabled
+
+
+# Class to represent an advertiser
+class Advertiser:
+    def __init__(self, name, bid, budget, min, reward, time_multipliers=None):
+        self.name = name # Advertiser name
+        self.original_bid = bid # Per impression bid at the start
+        self.bid = bid # Current per impression bid
+        self.budget = budget # Budget to spend after minimum impressions are met
+        self.spent = 0 # Amount paid for allocated impressions so far
+        self.min = min # Minimum impressions required
+        self.reward = reward # Reward for meeting minimum impressions
+        self.allocated = 0 # Impressions allocated to the advertiser
+        self.remaining = min # Remaining impressions to meet the minimum
+        self.max = min + (budget//bid) # Maximum possible impressions that can be allocated
+        self.time_multipliers = time_multipliers # Bid multiplier per time slot; None bids the same in every slot
+
+    def __str__(self):
+        return f"Advertiser {self.name} -> Bid: {self.bid}, Budget: {self.budget}, Minimum: {self.min}, Reward: {self.reward}, Allocated: {self.allocated}, Remaining: {self.remaining}, Maximum: {self.max}"
+
+    def get_time_multiplier(self, time_slot):
+        return 1.0 if self.time_multipliers is None else self.time_multipliers.get(time_slot, 1.0)
+
+    # Bid used to rank the advertiser in the current time slot
+    def get_effective_bid(self, time_slot):
+        if self.time_multipliers is None:
+            return self.bid
+        return self.bid * self.time_multipliers.get(time_slot, 1.0)
+
+    # Calculate revenue for the advertiser
+    def calculate_revenue(self):
+        total = 0
+        if self.allocated >= self.min:
+            total += (self.bid * self.allocated) + self.reward
+        return total
+
+
+# Estimate impressions for the current time slot
+def get_estimated_impressions(actual_impressions, initial_estimate, alpha=ALPHA):
+    estimated = [initial_estimate]
+    for i in range(1, len(actual_impressions)):
+        estimated.append(int(alpha * actual_impressions[i-1] + (1 - alpha) * estimated[i-1]))
+    return estimated
+
+
+# Give up to `impressions` to advertisers[index] towards its minimum; returns the impressions left over
+def allocate(advertisers, index, impressions):
+    advertiser = advertisers[index]
+    if impressions > 0 and advertiser.remaining > 0:
+        val = min(impressions, advertiser.remaining)
+        advertiser.allocated += val
+        advertiser.remaining -= val
+        advertiser.spent += val * advertiser.bid
+        return impressions - val
+    return impressions
+
+
+# Drop the advertisers that met their minimum, in one pass over the list
+def check_satisfaction(remaining_advertisers, recorder=NO_EVENTS, time_slot=-1):
+    satisfied = [adv for adv in remaining_advertisers if adv.remaining <= 0]
+    if satisfied:
+        remaining_advertisers[:] = [adv for adv in remaining_advertisers if adv.remaining > 0]
+        for adv in satisfied:
+            recorder.record(SATISFACTION, time_slot, adv.name)
+    return satisfied
+
+
+# The advertisers of the minimum-impression phase that are still short of their minimum, in
+# priority order. Allocations note the positions they satisfy as they happen; those stay in the
+# list as tombstones until the end of the pass, when the list is compacted once, slice by slice.
+# With whole-number bids and no time multipliers, total keeps the exact sum of remaining * bid
+# (integer-valued, so it equals the left-to-right float sum of the decay sweep while under 2**53),
+# updated on every allocation and drop; otherwise total is None and the estimates re-sum the weights.
+class ActiveSet:
+    def __init__(self, advertisers, running_total=True):
+        self.advertisers = advertisers # Priority order, as given by Strategy.order
+        self.satisfied = [i for i, adv in enumerate(advertisers) if adv.remaining <= 0] # Positions to drop after the pass
+        self.total = None
+        if running_total and all(adv.time_multipliers is None and float(adv.bid).is_integer() for adv in advertisers):
+            self.total = sum(adv.remaining * adv.bid for adv in advertisers)
+
+    def __len__(self):
+        return len(self.advertisers)
+
+    # allocate() on the advertiser at a position, inlined for the hot loop, noting it if it just met its minimum
+    def allocate(self, index, impressions):
+        advertiser = self.advertisers[index]
+        if impressions <= 0 or advertiser.remaining <= 0:
+            return impressions
+        val = min(impressions, advertiser.remaining)
+        advertiser.allocated += val
+        advertiser.remaining -= val
+        advertiser.spent += val * advertiser.bid
+        if self.total is not None:
+            self.total -= val * advertiser.bid
+        if advertiser.remaining <= 0:
+            self.satisfied.append(index)
+        return impressions - val
+
+    # Drop the advertisers satisfied since the last call, keeping the others in order
+    def drop_satisfied(self, recorder=NO_EVENTS, time_slot=-1):
+        if not self.satisfied:
+            return []
+        self.satisfied.sort()
+        advertisers = self.advertisers
+        dropped = [advertisers[i] for i in self.satisfied]
+        kept = advertisers[:self.satisfied[0]]
+        for i, j in zip(self.satisfied, self.satisfied[1:] + [len(advertisers)]):
+            kept += advertisers[i + 1:j]
+        self.advertisers = kept
+        self.satisfied = []
+        for adv in dropped:
+            if self.total is not None:
+                self.total -= adv.remaining * adv.bid
+            recorder.record(SATISFACTION, time_slot, adv.name)
+        return dropped
+
+
+# Hooks of the core loop. The defaults are the plain simulator: advertisers ordered once by
+# min * bid, decayed estimates made once per slot, fixed bids, GPG up to each advertiser's maximum.
+class Strategy:
+    per_slot_order = False # Re-order every advertiser at the start of each slot (time-dependent bids)
+    per_pass_estimates = False # Re-estimate the allocation before every pass instead of once per slot
+    budget_capped = False # GPG also stops at what the budget still pays for
+    running_total = True # Estimates may use ActiveSet's running total; False when bids change between slots
+
+    def __init__(self, decay_rate=DECAY_RATE, beta=BETA, gpg_method=GPG_METHOD, rng=None, min_decayed=0, slot_allocation=SLOT_ALLOCATION):
+        self.decay_rate = decay_rate
+        self.beta = beta
+        self.gpg_method = gpg_method
+        self.rng = rng # None draws GPG perturbations from fresh entropy
+        self.min_decayed = min_decayed # Least impressions decayed towards the first advertiser
+        self.slot_allocation = slot_allocation
+
+    # Called by run_bidding before the first slot of every run
+    def start(self, advertisers, num_time_slots):
+        pass
+
+    # Sort advertisers by expected revenue of meeting minimum impressions (stable, highest first)
+    def order(self, advertisers, time_slot):
+        advertisers_list = list(advertisers.values())
+        advertisers_list.sort(key=lambda advertiser: advertiser.min * advertiser.get_effective_bid(time_slot), reverse=True)
+        return advertisers_list
+
+    # Calculate the decay probability for the current time slot
+    def decay_probability(self, time_slot):
+        return math.exp(-self.decay_rate * time_slot)
+
+    # The first advertiser gets the decayed estimate, the rest share what is left by remaining * effective bid:
+    # (first advertiser's share, impressions left to share, weights of the others, their total).
+    # total is the caller's sum of every weight including the first (ActiveSet.total); None re-sums them
+    def split_estimate(self, advertisers, estimated, time_slot, total=None):
+        decayed = max(int(estimated * self.decay_probability(time_slot)), self.min_decayed)
+        first_adv = min(decayed, advertisers[0].remaining)
+        impressions_left = estimated - first_adv + (decayed-first_adv)
+        if total is None:
+            weights = [advertiser.remaining * advertiser.get_effective_bid(time_slot) for advertiser in advertisers[1:]]
+            return first_adv, impressions_left, weights, sum(weights)
+        # A running total means no time multipliers, so the effective bid is the bid
+        weights = [advertiser.remaining * advertiser.bid for advertiser in advertisers[1:]]
+        return first_adv, impressions_left, weights, total - advertisers[0].remaining * advertisers[0].bid
+
+    # Estimated shares of the slot before rounding
+    def allocation_weights(self, advertisers, estimated, time_slot, total=None):
+        if not advertisers:
+            return []
+        first_adv, impressions_left, weights, remaining_total = self.split_estimate(advertisers, estimated, time_slot, total)
+        if remaining_total > 0:
+            return [first_adv] + [(weight / remaining_total) * impressions_left for weight in weights]
+        return [first_adv] + [0] * len(weights)
+
+    # Estimated allocation of the slot, truncated to whole impressions
+    def estimated_allocation(self, advertisers, estimated, time_slot, total=None):
+        if not advertisers:
+            return []
+        first_adv, impressions_left, weights, remaining_total = self.split_estimate(advertisers, estimated, time_slot, total)
+        if remaining_total > 0:
+            return [first_adv] + [int((weight / remaining_total) * impressions_left) for weight in weights]
+        return [first_adv] + [0] * len(weights)
+
+    # Bid adjustment before each slot's allocation; bids are fixed by default
+    def adjust_bids(self, advertisers, time_slot, recorder):
+        pass
+
+    # Impressions GPG may still give the advertiser
+    def gpg_capacity(self, advertiser):
+        capacity = advertiser.max - advertiser.allocated
+        if self.budget_capped:
+            capacity = max(0, min(math.ceil(capacity), (advertiser.budget - advertiser.spent) // advertiser.bid))
+        return capacity
+
+    def exp_beta(self, random_value):
+        return math.exp(self.beta*(random_value - 1))
+
+    # Winner of one impression by GPG on effective bids: (name, perturbed bid), or (None, 0) when nobody has room
+    def gpg(self, advertisers, time_slot=0):
+        max_bid = float('-inf')
+        selected_advertiser = None
+        for advertiser in advertisers.values():
+            if self.gpg_capacity(advertiser) > 0:
+                bid = advertiser.get_effective_bid(time_slot) * (1-self.exp_beta(random.uniform(0,1)))
+                if bid > max_bid:
+                    max_bid = bid
+                    selected_advertiser = advertiser
+        if selected_advertiser is None:
+            return None, 0
+        return selected_advertiser.name, max_bid
+
+    # Allocate a whole block of impressions by GPG at once; returns impressions won per advertiser name
+    def gpg_block(self, advertisers, impressions, time_slot=0, rng=None):
+        advertiser_list = list(advertisers.values())
+        bids = [adv.get_effective_bid(time_slot) for adv in advertiser_list]
+        capacity = [self.gpg_capacity(adv) for adv in advertiser_list]
+        wins = GPG_METHODS[self.gpg_method](bids, capacity, impressions, self.beta, rng if rng is not None else self.rng)
+        won_by = {}
+        for advertiser, won in zip(advertiser_list, wins):
+            if won > 0:
+                advertiser.allocated += int(won)
+                advertiser.spent += int(won) * advertiser.bid
+                won_by[advertiser.name] = int(won)
+        return won_by
+
+
+# Array version of run_bidding for an AdvertiserPool with the default strategy; updates the pool in place
+def run_bidding_pool(pool, num_time_slots, actual_impressions, estimated_impressions, strategy, run_gpg=True, instrumentation=NO_INSTRUMENTATION):
+    order = priority_order(pool.bid, pool.min)
+    # Times and counts its own passes
+    remaining, leftover = simulate_minimum_phase(pool.bid[order], pool.min[order], actual_impressions, estimated_impressions,
+                                                 [strategy.decay_rate], num_time_slots, pool.remaining[order][None, :], instrumentation,
+                                                 strategy.slot_allocation)
+    pool.allocated[order] += pool.remaining[order] - remaining[0]
+    pool.remaining[order] = remaining[0]
+    # Bids are fixed once minimums are met, so every impression left over goes through GPG at once
+    if run_gpg and leftover[0] > 0:
+        instrumentation.count('gpg_calls')
+        with instrumentation.timer('gpg_phase'):
+            pool.allocated += GPG_METHODS[strategy.gpg_method](pool.bid, pool.max - pool.allocated, leftover[0], strategy.beta, strategy.rng)
+    return pool.total_revenue()
+
+
+# The core loop. Each slot, the remaining advertisers receive their estimated allocation in passes
+# until the slot's impressions run out or a pass places nothing; once every minimum is met the
+# rest goes through GPG. With water-filling slot allocation a pass places the whole slot split in
+# closed form, and another one follows only when every advertiser with weight met its minimum.
+# Returns the total revenue; slot_revenue, when given, receives the payments made in each slot
+# (dict advertisers only).
+def run_bidding(advertisers, num_time_slots, actual_impressions, estimated_impressions, strategy, run_gpg=True,
+                recorder=NO_EVENTS, instrumentation=NO_INSTRUMENTATION, slot_revenue=None):
+    if isinstance(advertisers, AdvertiserPool):
+        return run_bidding_pool(advertisers, num_time_slots, actual_impressions, estimated_impressions, strategy, run_gpg, instrumentation)
+    sim_running = True
+    # Hooks behind local flags, so a disabled run pays a branch per pass and nothing more
+    instrumented = instrumentation.enabled
+    record_allocations = recorder.enabled(ALLOCATION)
+    track_allocations = record_allocations or slot_revenue is not None or recorder.enabled(SLOT_END)
+    record_estimates = recorder.enabled(ESTIMATE)
+    if recorder.enabled(ADVERTISER):
+        for adv in advertisers.values():
+            recorder.record(ADVERTISER, advertiser=adv.name)
+    filling = strategy.slot_allocation == "water_filling"
+    strategy.start(advertisers, num_time_slots)
+    active = ActiveSet(strategy.order(advertisers, 0), strategy.running_total)
+
+    for time_slot in range(num_time_slots):
+        actual = actual_impressions[time_slot]
+        estimated = estimated_impressions[time_slot]
+        recorder.record(SLOT, time_slot, count=actual, total=estimated)
+        if instrumented:
+            instrumentation.count('slots')
+        strategy.adjust_bids(advertisers, time_slot, recorder)
+        if strategy.per_slot_order:
+            active = ActiveSet(strategy.order(advertisers, time_slot), strategy.running_total)
+            if recorder.enabled(PREFERENCE):
+                for adv in active.advertisers:
+                    recorder.record(PREFERENCE, time_slot, adv.name, a=adv.bid, b=adv.get_time_multiplier(time_slot), c=adv.get_effective_bid(time_slot))
+        estimate_slot = active.advertisers and not (strategy.per_pass_estimates or filling)
+        if estimate_slot:
+            estimated_allocation = strategy.estimated_allocation(active.advertisers, estimated, time_slot, active.total)
+            positions = [i for i, estimate in enumerate(estimated_allocation) if estimate > 0]
+            if record_estimates:
+                _record_estimates(recorder, time_slot, active.advertisers, estimated_allocation)
+
+        revenue = 0
+        while actual>0 and sim_running:
+            if active.advertisers:
+                if filling:
+                    weights = strategy.allocation_weights(active.advertisers, estimated, time_slot, active.total)
+                    estimated_allocation = water_fill(weights, [adv.remaining for adv in active.advertisers], actual).tolist()
+                elif strategy.per_pass_estimates:
+                    estimated_allocation = strategy.estimated_allocation(active.advertisers, estimated, time_slot, active.total)
+                if filling or strategy.per_pass_estimates:
+                    positions = [i for i, estimate in enumerate(estimated_allocation) if estimate > 0]
+                    if record_estimates:
+                        _record_estimates(recorder, time_slot, active.advertisers, estimated_allocation)
+                actual_before_pass = actual
+                if instrumented:
+                    started = time.perf_counter()
+                # The estimate stays indexed by list position while satisfied advertisers drop out,
+                # so only the positions with a positive estimate that are still in the list get a turn
+                num_active = len(active.advertisers)
+                for i in positions:
+                    if i >= num_active or actual <= 0:
+                        break
+                    val = min(estimated_allocation[i], actual)
+                    return_val = active.allocate(i, val)
+                    actual = actual - val + return_val
+                    if track_allocations:
+                        advertiser = active.advertisers[i]
+                        revenue += (val - return_val) * advertiser.bid
+                        if record_allocations and val > return_val:
+                            recorder.record(ALLOCATION, time_slot, advertiser.name, val - return_val, val, advertiser.bid, advertiser.get_effective_bid(time_slot))
+                if instrumented:
+                    allocated = time.perf_counter()
+                    instrumentation.add_time('minimum_phase', allocated - started)
+                dropped = active.drop_satisfied(recorder, time_slot)
+                if instrumented:
+                    instrumentation.add_time('check_satisfaction', time.perf_counter() - allocated)
+                    instrumentation.count('passes')
+                    instrumentation.count('satisfactions', len(dropped))
+                if actual == actual_before_pass:
+                    # Nothing left in this slot's estimated allocation, a further pass would spin forever
+                    break
+            elif run_gpg:
+                if instrumented:
+                    instrumentation.count('gpg_calls')
+                    started = time.perf_counter()
+                won_by = strategy.gpg_block(advertisers, actual, time_slot)
+                if instrumented:
+                    instrumentation.add_time('gpg_phase', time.perf_counter() - started)
+                served = sum(won_by.values())
+                for name, won in won_by.items():
+                    advertiser = advertisers[name]
+                    revenue += won * advertiser.bid
+                    if advertiser.time_multipliers is None:
+                        recorder.record(GPG_ALLOCATION, time_slot, name, won, a=math.nan)
+                    else:
+                        recorder.record(GPG_ALLOCATION, time_slot, name, won, a=advertiser.get_effective_bid(time_slot))
+                if served < actual:
+                    recorder.record(GPG_EXHAUSTED, time_slot, count=int(strategy.budget_capped))
+                    sim_running = False
+                actual -= served
+            else:
+                sim_running = False
+
+        if slot_revenue is not None:
+            slot_revenue[time_slot] = revenue
+        recorder.record(SLOT_END, time_slot, a=revenue)
+
+    total_revenue = 0
+    for advertiser in advertisers.values():
+        total_revenue += advertiser.calculate_revenue()
+    return total_revenue
+
+
+def _record_estimates(recorder, time_slot, advertisers, estimated_allocation):
+    for position, (adv, estimate) in enumerate(zip(advertisers, estimated_allocation)):
+        recorder.record(ESTIMATE, time_slot, adv.name, count=estimate, total=position)
@@ -0,0 +1,97 @@
+import numpy as np
+
+# Closed-form allocation of one slot's impressions among the advertisers of the minimum phase.
+# Instead of handing out truncated estimates pass after pass, the slot is split in proportion
+# to the estimate's weights in one step: advertisers whose remaining minimum is smaller than
+# their share are filled up to it and the rest is shared among the others (water-filling), then
+# the fractional shares are rounded to whole impressions by the largest remainder method.
+# The cost is one sort of the advertisers, however the impressions split.
+
+
+# Round non-negative quotas to integers that sum to `total`; the units left after flooring go to
+# the largest fractional parts (the earliest position on ties) without exceeding caps
+def largest_remainder(quotas, total, caps=None):
+    quotas = np.asarray(quotas, dtype=np.float64)
+    counts = np.floor(quotas).astype(np.int64)
+    if caps is not None:
+        counts = np.minimum(counts, caps)
+    left = int(total) - int(counts.sum())
+    if left > 0:
+        room = np.ones(counts.size, dtype=bool) if caps is None else counts < caps
+        candidates = np.flatnonzero(room)
+        fractions = quotas[candidates] - counts[candidates]
+        winners = candidates[np.argsort(-fractions, kind="stable")[:left]]
+        counts[winners] += 1
+    return counts
+
+
+# Split `impressions` in proportion to weights, giving no advertiser more than its cap.
+# Advertisers with zero weight get nothing; impressions nobody can take are left unplaced.
+# Returns the impressions placed with each advertiser.
+def water_fill(weights, caps, impressions):
+    weights = np.asarray(weights, dtype=np.float64)
+    caps = np.asarray(caps, dtype=np.int64)
+    placed = np.zeros(weights.size, dtype=np.int64)
+    takers = np.flatnonzero((weights > 0) & (caps > 0))
+    if takers.size == 0 or impressions <= 0:
+        return placed
+    w, c = weights[takers], caps[takers]
+    if c.sum() <= impressions:
+        placed[takers] = c
+        return placed
+
+    # Level lam with sum(min(c, lam * w)) == impressions. Past an advertiser's fill level c / w it
+    # contributes c, below it lam * w, so the level lies between two consecutive fill levels.
+    levels = c / w
+    order = np.argsort(levels, kind="stable")
+    filled = np.concatenate(([0], np.cumsum(c[order]))) # Impressions of the advertisers filled below each level
+    unfilled = np.concatenate((np.cumsum(w[order][::-1])[::-1], [0.0])) # Weight still filling at each level
+    at_level = filled[:-1] + levels[order] * unfilled[:-1] # Impressions placed with lam at each fill level
+    k = int(np.searchsorted(at_level, impressions))
+    lam = (impressions - filled[k]) / unfilled[k]
+    quotas = np.minimum(c, lam * w)
+    placed[takers] = largest_remainder(quotas, impressions, c)
+    return placed
+
+
+# water_fill for every row of (rows x advertisers) weights and caps at once, with impressions per row.
+# Non-takers are sorted past every fill level, so each row gives the same result as water_fill.
+def water_fill_rows(weights, caps, impressions):
+    weights = np.asarray(weights, dtype=np.float64)
+    caps = np.asarray(caps, dtype=np.int64)
+    impressions = np.asarray(impressions, dtype=np.int64)
+    takers = (weights > 0) & (caps > 0)
+    w = np.where(takers, weights, 0.0)
+    c = np.where(takers, caps, 0)
+    placed = c.copy()
+    rows = np.flatnonzero((c.sum(axis=1) > impressions) & (impressions > 0))
+    placed[impressions <= 0] = 0
+    if rows.size == 0:
+        return placed
+
+    w, c, target = w[rows], c[rows], impressions[rows]
+    with np.errstate(divide="ignore"):
+        levels = np.where(takers[rows], c / np.where(takers[rows], w, 1.0), np.inf)
+    order = np.argsort(levels, axis=1, kind="stable")
+    sorted_levels = np.take_along_axis(levels, order, axis=1)
+    sorted_w = np.take_along_axis(w, order, axis=1)
+    filled = np.concatenate((np.zeros((rows.size, 1), dtype=np.int64), np.cumsum(np.take_along_axis(c, order, axis=1), axis=1)), axis=1)
+    unfilled = np.concatenate((np.cumsum(sorted_w[:, ::-1], axis=1)[:, ::-1], np.zeros((rows.size, 1))), axis=1)
+    with np.errstate(invalid="ignore"):
+        at_level = np.where(np.isinf(sorted_levels), np.inf, filled[:, :-1] + sorted_levels * unfilled[:, :-1])
+    k = (at_level < target[:, None]).sum(axis=1)
+    index = np.arange(rows.size)
+    lam = (target - filled[index, k]) / unfilled[index, k]
+    quotas = np.where(takers[rows], np.minimum(c, lam[:, None] * w), 0.0)
+    placed[rows] = largest_remainder_rows(quotas, target, c)
+    return placed
+
+
+# largest_remainder for every row of quotas at once, with a total and caps per row
+def largest_remainder_rows(quotas, totals, caps):
+    counts = np.minimum(np.floor(quotas).astype(np.int64), caps)
+    left = totals - counts.sum(axis=1)
+    fractions = np.where(counts < caps, quotas - counts, -np.inf)
+    order = np.argsort(-fractions, axis=1, kind="stable")
+    np.put_along_axis(counts, order, np.take_along_axis(counts, order, axis=1) + (np.arange(counts.shape[1]) < left[:, None]), axis=1)
+    return counts
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from advertiser_pool import AdvertiserPool
+from decay_sweep import decay_sweep
+from simulation_engine import Advertiser, Strategy, run_bidding, get_estimated_impressions
+
+NUM_TIME_SLOTS = 24
+DECAY_FACTORS = np.arange(0, 1.01, 0.05)
+
+
+# Whole-number bids and minimums, some of them zero, with traffic that satisfies some advertisers
+def random_campaign(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 30))
+    rows = list(zip(rng.integers(1, 40, n).astype(float), rng.integers(50, 2000, n).astype(float),
+                    rng.integers(0, 3000, n) * rng.integers(0, 2, n) if seed % 3 == 0 else rng.integers(1, 3000, n),
+                    rng.integers(0, 200, n).astype(float)))
+    actual = rng.integers(50, 800, NUM_TIME_SLOTS) * int(rng.integers(1, 20))
+    return rows, actual, get_estimated_impressions(actual, 2500)
+
+
+def advertisers(rows):
+    return {str(k): Advertiser(str(k), bid, budget, int(minimum), reward) for k, (bid, budget, minimum, reward) in enumerate(rows)}
+
+
+@pytest.mark.parametrize("seed", range(60))
+@pytest.mark.parametrize("slot_allocation", ["water_filling", "passes"])
+def test_sweep_matches_scalar_runs(seed, slot_allocation):
+    rows, actual, estimated = random_campaign(seed)
+    swept = decay_sweep(advertisers(rows), actual, estimated, DECAY_FACTORS, NUM_TIME_SLOTS, slot_allocation=slot_allocation)
+    scalar = [run_bidding(advertisers(rows), NUM_TIME_SLOTS, actual, estimated, Strategy(decay, slot_allocation=slot_allocation), run_gpg=False)
+              for decay in DECAY_FACTORS]
+    assert swept.tolist() == scalar
+
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("slot_allocation", ["water_filling", "passes"])
+def test_pool_matches_dict_minimum_phase(seed, slot_allocation):
+    rows, actual, estimated = random_campaign(seed)
+    dict_advertisers = advertisers(rows)
+    pool = AdvertiserPool.from_advertisers(dict_advertisers)
+    strategy = Strategy(0.05, slot_allocation=slot_allocation)
+    run_bidding(dict_advertisers, NUM_TIME_SLOTS, actual, estimated, strategy, run_gpg=False)
+    run_bidding(pool, NUM_TIME_SLOTS, actual, estimated, strategy, run_gpg=False)
+    assert pool.remaining.tolist() == [adv.remaining for adv in dict_advertisers.values()]
+    assert pool.allocated.tolist() == [adv.allocated for adv in dict_advertisers.values()]
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+import monte_carlo
+import monte_carlo_ratio
+from conftest import REPO_ROOT
+
+NUM_SIMULATIONS = 10
+
+
+def columns(results):
+    return {name: [np.asarray(row) for row in results[name]] for name in results.columns()}
+
+
+# A run stopped after `first` simulations and resumed to the end stores exactly what one uninterrupted run stores
+@pytest.mark.parametrize("module, options", [
+    (monte_carlo, {}),
+    (monte_carlo_ratio, {'bound_mode': True, 'partial_allocation': True}),
+])
+def test_resume_is_bit_identical(module, options, tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+    settings = dict(min_adv=5, max_adv=20, seed=1234, workers=1, **options)
+    whole = module.MonteCarloSimulation().run_monte_carlo(NUM_SIMULATIONS, output=str(tmp_path / 'whole'), **settings)
+    module.MonteCarloSimulation().run_monte_carlo(4, output=str(tmp_path / 'resumed'), **settings)
+    resumed = module.MonteCarloSimulation().run_monte_carlo(NUM_SIMULATIONS, output=str(tmp_path / 'resumed'), resume=True, **settings)
+
+    assert len(resumed) == len(whole) == NUM_SIMULATIONS
+    assert resumed.metadata() == whole.metadata()
+    expected, actual = columns(whole), columns(resumed)
+    assert expected.keys() == actual.keys()
+    for name in expected:
+        for a, b in zip(expected[name], actual[name]):
+            assert a.tobytes() == b.tobytes(), name
+
+
+def test_resume_rejects_other_settings(tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+    simulation = monte_carlo.MonteCarloSimulation()
+    simulation.run_monte_carlo(2, min_adv=5, max_adv=20, seed=1, workers=1, output=str(tmp_path / 'store'))
+    with pytest.raises(ValueError):
+        simulation.run_monte_carlo(4, min_adv=5, max_adv=30, workers=1, output=str(tmp_path / 'store'), resume=True)
@@ -0,0 +1,54 @@
+import itertools
+import numpy as np
+import pytest
+from optimal_solver import knapsack_dp, knapsack_branch_and_bound, solve_knapsack, knapsack_bounds
+
+
+# Small knapsacks with integer values, some zero weights and zero values
+def random_instance(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 11))
+    weights = rng.integers(0, 60, n) * rng.integers(1, 4)
+    values = rng.integers(0, 500, n).astype(np.float64)
+    capacity = int(rng.integers(0, max(1, int(weights.sum()))))
+    return weights, values, capacity
+
+
+# Best value over every subset that fits
+def brute_force(weights, values, capacity):
+    best = 0.0
+    for size in range(1, len(weights) + 1):
+        for subset in itertools.combinations(range(len(weights)), size):
+            if weights[list(subset)].sum() <= capacity:
+                best = max(best, values[list(subset)].sum())
+    return best
+
+
+def check_solution(weights, values, capacity, value, chosen):
+    assert weights[chosen].sum() <= capacity
+    assert len(set(chosen)) == len(chosen)
+    assert values[chosen].sum() == pytest.approx(value)
+
+
+@pytest.mark.parametrize("seed", range(200))
+@pytest.mark.parametrize("solver", [knapsack_dp, knapsack_branch_and_bound, solve_knapsack])
+def test_solvers_match_brute_force(solver, seed):
+    weights, values, capacity = random_instance(seed)
+    value, chosen = solver(weights, values, capacity)
+    assert value == pytest.approx(brute_force(weights, values, capacity))
+    check_solution(weights, values, capacity, value, list(chosen))
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_bounds_enclose_optimum(seed):
+    weights, values, capacity = random_instance(seed)
+    upper, lower, chosen = knapsack_bounds(weights, values, capacity)
+    optimum = brute_force(weights, values, capacity)
+    assert lower <= optimum + 1e-9
+    assert optimum <= upper + 1e-9
+    check_solution(weights, values, capacity, lower, chosen)
+
+
+def test_dp_falls_back_to_branch_and_bound():
+    weights, values, capacity = random_instance(7)
+    assert solve_knapsack(weights, values, capacity, max_dp_cells=0)[0] == pytest.approx(brute_force(weights, values, capacity))
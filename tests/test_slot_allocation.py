@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from slot_allocation import largest_remainder, water_fill, water_fill_rows
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_largest_remainder_rounds_to_total(seed):
+    rng = np.random.default_rng(seed)
+    quotas = rng.random(int(rng.integers(1, 20))) * 50
+    total = int(round(quotas.sum()))
+    quotas *= total / quotas.sum()
+    counts = largest_remainder(quotas, total)
+    assert counts.sum() == total
+    assert np.all(np.abs(counts - quotas) < 1)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_largest_remainder_respects_caps(seed):
+    rng = np.random.default_rng(seed)
+    caps = rng.integers(0, 20, int(rng.integers(1, 20)))
+    quotas = caps * rng.random(caps.size)
+    total = int(np.floor(quotas.sum()))
+    counts = largest_remainder(quotas, total, caps)
+    assert counts.sum() == total
+    assert np.all(counts <= caps)
+    assert np.all(counts >= np.floor(quotas))
+
+
+# Weights with zeros and ties, caps with zeros, impressions from none to more than everyone can take
+def random_fill(rng, rows=None):
+    shape = (int(rng.integers(1, 15)),) if rows is None else (rows, int(rng.integers(1, 15)))
+    weights = np.round(rng.random(shape) * 10) * rng.integers(0, 2, shape)
+    caps = rng.integers(0, 80, shape) * rng.integers(0, 2, shape)
+    impressions = rng.integers(-5, 600) if rows is None else rng.integers(-5, 600, rows)
+    return weights, caps, impressions
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_water_fill_invariants(seed):
+    weights, caps, impressions = random_fill(np.random.default_rng(seed))
+    placed = water_fill(weights, caps, impressions)
+    takers = (weights > 0) & (caps > 0)
+    assert np.all(placed >= 0)
+    assert np.all(placed <= caps)
+    assert np.all(placed[~takers] == 0)
+    assert placed.sum() == min(max(impressions, 0), caps[takers].sum())
+
+    # One level serves every taker short of its cap in proportion to its weight, up to rounding,
+    # and the takers at their cap fill below that level
+    unfilled = takers & (placed < caps)
+    if impressions > 0 and unfilled.any():
+        low = ((placed[unfilled] - 1) / weights[unfilled]).max()
+        high = ((placed[unfilled] + 1) / weights[unfilled]).min()
+        assert low <= high
+        full = takers & (placed == caps)
+        assert np.all((caps[full] - 1) / weights[full] <= high)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_water_fill_rows_matches_water_fill(seed):
+    rng = np.random.default_rng(seed)
+    weights, caps, impressions = random_fill(rng, rows=int(rng.integers(1, 6)))
+    expected = [water_fill(w, c, i) for w, c, i in zip(weights, caps, impressions)]
+    assert np.array_equal(water_fill_rows(weights, caps, impressions), np.array(expected))
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+# Recorded traffic replayed from a trace file.
+# A trace is a .npy file of impression counts shaped (days, slots_per_day), e.g. 24 hourly
+# or 1440 per-minute slots. It is memory-mapped, so windows are array views served
+# straight from the page cache and a year of traffic is never loaded into RAM at once.
+
+TRACE_DTYPE = np.int32
+CSV_CHUNK_ROWS = 1 << 20 # Log rows converted per chunk when building a trace
+
+
+# Convert an impression log (one count per row, in time order) into a trace file, chunk by chunk
+def build_trace(csv_path, trace_path, slots_per_day, column='Impressions'):
+    rows = sum(len(chunk) for chunk in pd.read_csv(csv_path, usecols=[column], chunksize=CSV_CHUNK_ROWS))
+    days = rows // slots_per_day
+    if days == 0:
+        raise ValueError(f"{csv_path} holds {rows} slots, less than one day of {slots_per_day}")
+    trace = np.lib.format.open_memmap(trace_path, mode='w+', dtype=TRACE_DTYPE, shape=(days, slots_per_day))
+    flat = trace.reshape(-1)
+    written = 0
+    for chunk in pd.read_csv(csv_path, usecols=[column], chunksize=CSV_CHUNK_ROWS):
+        values = chunk[column].to_numpy()[:flat.size - written]
+        flat[written:written + values.size] = values
+        written += values.size
+    trace.flush()
+    return TraceTraffic(trace_path)
+
+
+# Traffic source backed by a trace file; a drop-in for TrafficSimulator
+class TraceTraffic:
+    def __init__(self, path):
+        self.path = path
+        self.counts = np.load(path, mmap_mode='r')
+        self.days, self.slots_per_day = self.counts.shape
+        self.slots = self.counts.reshape(-1) # Every slot in time order, still a view of the file
+        self.cursor = 0 # Next slot served by sequential replay
+
+    # Workers reopen the file instead of receiving a copy of it
+    def __getstate__(self):
+        return {'path': self.path, 'cursor': self.cursor}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+        self.cursor = state['cursor']
+
+    def __len__(self):
+        return self.slots.size
+
+    def day(self, day):
+        return self.counts[day]
+
+    # Trace slots per simulator slot when a day of the trace is replayed as time_slots slots,
+    # e.g. 60 for a per-minute trace driving an hourly simulation
+    def slot_size(self, time_slots):
+        if time_slots <= 0 or self.slots_per_day % time_slots:
+            raise ValueError(f"{self.slots_per_day} trace slots per day do not divide into {time_slots} simulator slots")
+        return self.slots_per_day // time_slots
+
+    # time_slots consecutive slots starting at slot `start`, as a zero-copy view.
+    # slot_size > 1 sums groups of slots (e.g. 60 per-minute slots into an hour), which copies the window.
+    def window(self, start, time_slots, slot_size=1):
+        end = start + time_slots * slot_size
+        if start < 0 or end > self.slots.size:
+            raise IndexError(f"Window [{start}, {end}) is outside the trace of {self.slots.size} slots")
+        view = self.slots[start:end]
+        return view if slot_size == 1 else view.reshape(time_slots, slot_size).sum(axis=1, dtype=TRACE_DTYPE)
+
+    # Same call as TrafficSimulator: one day of the trace in time_slots slots, the next day in
+    # sequential replay (wrapping at the end) or with rng a random day
+    def get_actual_impressions(self, time_slots, rng=None):
+        slot_size = self.slot_size(time_slots)
+        if rng is not None:
+            return self.window(int(rng.integers(self.days)) * self.slots_per_day, time_slots, slot_size)
+        if self.cursor + self.slots_per_day > self.slots.size:
+            self.cursor = 0
+        actual_impressions = self.window(self.cursor, time_slots, slot_size)
+        self.cursor += self.slots_per_day
+        return actual_impressions
+
+    # n_runs days as an (n_runs x time_slots) matrix; consecutive days from the start of the trace
+    # at the trace's own resolution are a view of the file, random days (with rng) or days summed
+    # into wider slots are a copy
+    def get_actual_impressions_batch(self, n_runs, time_slots, rng=None, antithetic=False):
+        if antithetic:
+            raise ValueError("Recorded traffic has no antithetic counterpart")
+        slot_size = self.slot_size(time_slots)
+        if rng is None:
+            if n_runs > self.days:
+                raise IndexError(f"The trace holds {self.days} days, not {n_runs}")
+            days = self.counts[:n_runs]
+        else:
+            days = self.counts[rng.integers(self.days, size=n_runs)]
+        return days if slot_size == 1 else days.reshape(n_runs, time_slots, slot_size).sum(axis=2, dtype=TRACE_DTYPE)
@@ -10,14 +10,39 @@ class TrafficSimulator:
         self.peak_end = peak_end
         self.peak_amplitude = peak_amplitude
 
-    def get_actual_impressions(self, time_slots):
-        base_impressions = np.random.uniform(self.min_impressions, self.max_impressions, time_slots)
-        for t in range(time_slots):
-            if t >= self.peak_start and t <= self.peak_end:
-                base_impressions[t] *= self.peak_amplitude 
+    # Which time slots fall inside the peak window
+    def peak_mask(self, time_slots):
+        t = np.arange(time_slots)
+        return (t >= self.peak_start) & (t <= self.peak_end)
 
-        noise = np.random.normal(0, 200, time_slots)
+    def get_actual_impressions(self, time_slots, rng=None):
+        rng = rng if rng is not None else np.random
+        base_impressions = rng.uniform(self.min_impressions, self.max_impressions, time_slots)
+        base_impressions[self.peak_mask(time_slots)] *= self.peak_amplitude
+
+        noise = rng.normal(0, 200, time_slots)
         simulated_impressions = base_impressions + noise
         simulated_impressions = np.clip(simulated_impressions, self.min_impressions, self.max_impressions)
         simulated_impressions = simulated_impressions.astype(int)
-        return simulated_impressions
\ No newline at end of file
+        return simulated_impressions
+
+    # Traffic of n_runs independent runs in one call, as an (n_runs x time_slots) int32 matrix.
+    # With antithetic set, rows come in mirrored pairs (u, 1 - u for the base and z, -z for the noise),
+    # so the average of a pair has lower variance than two independent runs.
+    def get_actual_impressions_batch(self, n_runs, time_slots, rng=None, antithetic=False):
+        rng = rng if rng is not None else np.random.default_rng()
+        if antithetic:
+            half = (n_runs + 1) // 2
+            uniform = rng.random((half, time_slots))
+            normal = rng.standard_normal((half, time_slots))
+            uniform = np.stack((uniform, 1 - uniform), axis=1).reshape(-1, time_slots)[:n_runs]
+            normal = np.stack((normal, -normal), axis=1).reshape(-1, time_slots)[:n_runs]
+            base_impressions = self.min_impressions + (self.max_impressions - self.min_impressions) * uniform
+            noise = 200 * normal
+        else:
+            base_impressions = rng.uniform(self.min_impressions, self.max_impressions, (n_runs, time_slots))
+            noise = rng.normal(0, 200, (n_runs, time_slots))
+        base_impressions *= np.where(self.peak_mask(time_slots), self.peak_amplitude, 1.0)
+
+        simulated_impressions = np.clip(base_impressions + noise, self.min_impressions, self.max_impressions)
+        return simulated_impressions.astype(np.int32)